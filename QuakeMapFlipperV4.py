@@ -3,6 +3,29 @@ from tkinter import filedialog, messagebox, ttk
 import re
 import os
 import math
+import io
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import time
+import signal
+import socket
+import stat
+import ipaddress
+import socketserver
+import threading
+import argparse
+import collections
+import functools
+import concurrent.futures
+import http.client
+import http.server
+import urllib.parse
+import queue
+import zlib
+import shutil
 
 # --- Regular Expressions ---
 entity_origin_re = re.compile(r'^\s*("origin")\s*("(-?\d+\.?\d*)\s+(-?\d+\.?\d*)\s+(-?\d+\.?\d*)")\s*$')
@@ -13,6 +36,7 @@ entity_classname_re = re.compile(r'^\s*("classname")\s*("([^"]*)")\s*$')
 # Added: Regex for message and map keys (match content inside quotes)
 entity_message_re = re.compile(r'^\s*("message")\s*("([^"]*)")\s*$')
 entity_map_re = re.compile(r'^\s*("map")\s*("([^"]*)")\s*$')
+entity_wad_re = re.compile(r'^\s*("wad")\s*("([^"]*)")\s*$')
 # Plane definition (same as before)
 plane_re = re.compile(
     r'^\s*'
@@ -23,6 +47,25 @@ plane_re = re.compile(
     r'(-?\d+\.?\d*)\s+(-?\d+\.?\d*)\s+(-?\d+\.?\d*)\s+'
     r'(-?\d+\.?\d*)\s+(-?\d+\.?\d*)\s*$'
 )
+# Added: Dialect face grammars. The dialect detected for a file is tried first on its faces.
+_NUM = r'(-?\d+\.?\d*)'
+_POINTS = r'^\s*' + (r'\(\s*' + r'\s+'.join([_NUM] * 3) + r'\s*\)\s*') * 3
+_STANDARD_TEX = r'([^\s]+)\s+' + r'\s+'.join([_NUM] * 5)
+# Quake 2 / Quake 3 (legacy): contents, flags, value after the standard fields (editors drop them when zero)
+plane_re_quake2 = re.compile(_POINTS + _STANDARD_TEX + r'((?:\s+-?\d+\s+-?\d+\s+-?\d+)?)\s*$')
+# Daikatana: Quake 2 fields plus optional surface colour
+plane_re_daikatana = re.compile(_POINTS + _STANDARD_TEX + r'(\s+-?\d+\s+-?\d+\s+-?\d+(?:\s+-?\d+\s+-?\d+\s+-?\d+)?)\s*$')
+# Valve 220 (Half-Life): explicit texture axes; Quake 2 style flags may follow
+plane_re_valve = re.compile(
+    _POINTS + r'([^\s]+)\s+'
+    r'\[\s*' + r'\s+'.join([_NUM] * 4) + r'\s*\]\s*'
+    r'\[\s*' + r'\s+'.join([_NUM] * 4) + r'\s*\]\s*'
+    + r'\s+'.join([_NUM] * 3) + r'((?:\s+-?\d+)*)\s*$'
+)
+# Quake 3 brushDef face: three points, a texture matrix, then the rest of the line untouched
+plane_re_brushdef = re.compile(_POINTS + r'(\(\s*\(.*?\)\s*\(.*?\)\s*\).*)$')
+# Quake 3 patch control point: ( x y z u v )
+patch_point_re = re.compile(r'\(\s*' + r'\s+'.join([_NUM] * 5) + r'\s*\)')
 
 # Helper to format numbers
 def format_num(val):
@@ -36,155 +79,1376 @@ def format_num(val):
 def normalize_angle(angle):
     return angle % 360
 
-def process_map_file(input_path, output_path, flip_x, flip_y, flip_z):
-    if not (flip_x or flip_y or flip_z):
-        messagebox.showerror("Error", "Please select at least one axis to flip.")
+# --- WAD Texture Index ---
+# Offsets can only be wrapped correctly when the texture size is known, so the "wad"
+# key of worldspawn is resolved and each WAD's lump directory is read (no pixel data).
+WAD_MIPTEX_TYPES = (0x44, 0x43) # WAD2 (Quake) and WAD3 (Half-Life) miptex lumps
+_wad_index_memo = {}
+
+def default_cache_dir():
+    """Where on-disk caches live. Override with the QUAKEMAPFLIPPER_CACHE environment variable."""
+    return os.environ.get("QUAKEMAPFLIPPER_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "QuakeMapFlipper")
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def read_wad_texture_sizes(wad_path):
+    """Reads {texture name: (width, height)} from a WAD2/WAD3 lump directory."""
+    sizes = {}
+    with open(wad_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as wad:
+        magic, num_lumps, dir_offset = struct.unpack_from("<4sii", wad, 0)
+        if magic not in (b"WAD2", b"WAD3"):
+            raise ValueError(f"Not a WAD2/WAD3 file: {wad_path}")
+        for entry in range(num_lumps):
+            file_pos, disk_size, size, lump_type, compression, name = struct.unpack_from(
+                "<iiiBBxx16s", wad, dir_offset + entry * 32)
+            if lump_type not in WAD_MIPTEX_TYPES or compression:
+                continue
+            # miptex header: name[16], width, height -- pixel data is never touched
+            width, height = struct.unpack_from("<II", wad, file_pos + 16)
+            name = name.split(b"\0", 1)[0].decode('latin-1').lower()
+            sizes.setdefault(name, (width, height))
+    return sizes
+
+def load_wad_texture_sizes(wad_path, cache_dir=None):
+    """Like read_wad_texture_sizes, but cached in memory and on disk by WAD path, size and
+    modification time. Hashing the contents would read far more of the WAD than the scan does."""
+    st = os.stat(wad_path)
+    memo_key = (os.path.abspath(wad_path), st.st_size, st.st_mtime_ns)
+    if memo_key in _wad_index_memo:
+        return _wad_index_memo[memo_key]
+    digest = hashlib.sha1(repr(memo_key).encode('utf-8', 'surrogateescape')).hexdigest()
+    cache_path = os.path.join(cache_dir or default_cache_dir(), "wad", f"{digest}.json")
+    try:
+        with open(cache_path) as f:
+            sizes = {name: tuple(size) for name, size in json.load(f).items()}
+    except (OSError, ValueError):
+        sizes = read_wad_texture_sizes(wad_path)
+        try:
+            _write_json_atomic(cache_path, sizes)
+        except OSError as e:
+            print(f"Warning: Could not write WAD cache {cache_path}. {e}")
+    _wad_index_memo[memo_key] = sizes
+    return sizes
+
+def resolve_wad_paths(wad_value, search_dirs):
+    """Finds the files named by a worldspawn "wad" value (';'-separated, often editor-absolute)."""
+    found = []
+    for entry in wad_value.split(";"):
+        entry = entry.strip().replace("\\", "/")
+        if not entry:
+            continue
+        candidates = [entry] if os.path.isabs(entry) else []
+        for directory in search_dirs:
+            candidates.append(os.path.join(directory, entry.lstrip("/")))
+            candidates.append(os.path.join(directory, os.path.basename(entry)))
+        path = next((c for c in candidates if os.path.isfile(c)), None)
+        if path:
+            found.append(path)
+        else:
+            print(f"Warning: WAD not found: {entry}")
+    return found
+
+def texture_sizes_for_wad_key(wad_value, search_dirs, cache_dir=None):
+    """Merged texture size index for every WAD listed in a worldspawn "wad" value."""
+    sizes = {}
+    for path in resolve_wad_paths(wad_value, search_dirs):
+        try:
+            for name, size in load_wad_texture_sizes(path, cache_dir).items():
+                sizes.setdefault(name, size) # Earlier WADs win, like the compilers
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Warning: Could not read WAD {path}. {e}")
+    return sizes
+
+# --- Texture Remap ---
+# Swaps textures while flipping, e.g. mirrored text and signage for their readable
+# versions. The table is one dict, looked up per face only when it isn't empty.
+def load_texture_map(path):
+    """Reads a remap table: one "source replacement [offset_x offset_y]" per line, with
+    // or # comments. Offsets are added to the flipped face. Returns
+    {lowercase source name: (replacement, offset_x, offset_y)}."""
+    texture_map = {}
+    with open(path, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            fields = line.split("//", 1)[0].split("#", 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) not in (2, 4):
+                raise ValueError(f"{path}:{line_num}: expected 'source replacement [offset_x offset_y]'")
+            try:
+                adjust_x, adjust_y = map(float, fields[2:]) if len(fields) == 4 else (0.0, 0.0)
+            except ValueError:
+                raise ValueError(f"{path}:{line_num}: offsets must be numbers")
+            texture_map[fields[0].lower()] = (fields[1], adjust_x, adjust_y)
+    return texture_map
+
+def _remap_texture(dialect, plane, texture_map, flip_x, flip_y):
+    """The parsed face with its texture swapped, if the table has an entry for it."""
+    remap = texture_map.get(plane[1].lower())
+    return dialect.retexture(plane, *remap, flip_x, flip_y) if remap else plane
+
+
+# --- Progress and Cancellation ---
+PROGRESS_BYTE_STEP = 256 * 1024 # Bytes between clock checks; keeps progress out of the hot loop
+
+class FlipCancelled(Exception):
+    """Raised when a CancelToken is cancelled during a flip."""
+
+class CancelToken:
+    """Cooperative cancellation, checked where entities and brushes start."""
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class ProgressPrinter:
+    """Progress callback that keeps a live percentage/throughput/ETA line on a stream."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.start = time.perf_counter()
+
+    def __call__(self, bytes_done, total_bytes):
+        elapsed = max(time.perf_counter() - self.start, 1e-6)
+        rate = bytes_done / elapsed
+        if total_bytes:
+            eta = (total_bytes - bytes_done) / rate if rate else 0.0
+            text = f"{100.0 * bytes_done / total_bytes:5.1f}%  {rate / 1e6:6.2f} MB/s  ETA {eta:4.1f}s"
+        else:
+            text = f"{bytes_done / 1e6:8.2f} MB  {rate / 1e6:6.2f} MB/s"
+        self.stream.write("\r" + text)
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.write("\n")
+
+_CLASSNAME_RULES = frozenset(("worldspawn", "trigger_changelevel")) # Classnames _match_entity_line treats specially
+
+def _match_entity_line(line, classname):
+    """Finds which rewrite (if any) applies to a level-1 key line. Returns (kind, match)."""
+    # --- Worldspawn Message ---
+    if classname == "worldspawn":
+        message_match = entity_message_re.match(line)
+        if message_match: return "message", message_match
+    # --- Trigger_Changelevel Map ---
+    elif classname == "trigger_changelevel":
+        map_match = entity_map_re.match(line)
+        if map_match: return "map", map_match
+    # --- Origin / Angle / Angles ---
+    origin_match = entity_origin_re.match(line)
+    if origin_match: return "origin", origin_match
+    angle_match = entity_angle_re.match(line)
+    if angle_match: return "angle", angle_match
+    angles_match = entity_angles_re.match(line)
+    if angles_match: return "angles", angles_match
+    return None, None
+
+def _flip_entity_line(kind, match, flip_x, flip_y, flip_z):
+    """Rewrites a key line matched by _match_entity_line for one axis config."""
+    key = match.group(1)
+    if kind == "message":
+        new_value = match.group(3) + " Flipped"
+        return f'	{key} "{new_value}"\n' # Use tab for standard formatting
+    if kind == "map":
+        new_value = match.group(3) + "_flipped"
+        return f'	{key} "{new_value}"\n' # Use tab
+    if kind == "origin":
+        x, y, z = map(float, [match.group(3), match.group(4), match.group(5)])
+        new_x, new_y, new_z = (-x if flip_x else x, -y if flip_y else y, -z if flip_z else z)
+        return f'	{key} "{format_num(new_x)} {format_num(new_y)} {format_num(new_z)}"\n'
+    if kind == "angle":
+        current_angle = int(match.group(3))
+        new_angle = float(current_angle)
+        if current_angle < 0: # Up/Down
+            if flip_z: new_angle = -1.0 if current_angle == -2 else -2.0
+        else: # Direction/Facing
+            if flip_x: new_angle = 180.0 - new_angle
+            if flip_y: new_angle = -new_angle
+            new_angle = normalize_angle(new_angle)
+        return f'	{key} "{int(round(new_angle))}"\n'
+    # --- Angles (Pitch Yaw Roll) ---
+    pitch, yaw, roll = map(float, [match.group(3), match.group(4), match.group(5)])
+    new_pitch, new_yaw, new_roll = pitch, yaw, roll
+    if flip_x: new_yaw, new_roll = 180.0 - new_yaw, -new_roll
+    if flip_y: new_yaw, new_roll = -new_yaw, -new_roll
+    if flip_z: new_pitch = -new_pitch
+    new_yaw = normalize_angle(new_yaw)
+    return f'	{key} "{format_num(new_pitch)} {format_num(new_yaw)} {format_num(new_roll)}"\n'
+
+def _parse_plane(plane_match):
+    """Numbers from a plane_re match:
+    (9 vertex coords, tex_name, off_x, off_y, rot, scale_x, scale_y, extra fields text)."""
+    verts = tuple(map(float, plane_match.group(1, 2, 3, 4, 5, 6, 7, 8, 9)))
+    off_x, off_y, rot = map(float, plane_match.group(11, 12, 13))
+    scale_x, scale_y = map(float, plane_match.group(14, 15))
+    extra = plane_match.group(16) if plane_match.re.groups >= 16 else ""
+    return verts, plane_match.group(10), off_x, off_y, rot, scale_x, scale_y, extra
+
+def _flip_plane(plane, flip_x, flip_y, flip_z, reverse_winding, texture_sizes):
+    """Builds the flipped face line for one axis config from _parse_plane output."""
+    (v1x, v1y, v1z, v2x, v2y, v2z, v3x, v3y, v3z), tex_name, off_x, off_y, rot, scale_x, scale_y, extra = plane
+    # Flip Vertices
+    nv1x, nv1y, nv1z = (-v1x if flip_x else v1x, -v1y if flip_y else v1y, -v1z if flip_z else v1z)
+    nv2x, nv2y, nv2z = (-v2x if flip_x else v2x, -v2y if flip_y else v2y, -v2z if flip_z else v2z)
+    nv3x, nv3y, nv3z = (-v3x if flip_x else v3x, -v3y if flip_y else v3y, -v3z if flip_z else v3z)
+    fmt_v = lambda x,y,z: " ".join(map(format_num, [x,y,z]))
+    v1_str, v2_str, v3_str = fmt_v(nv1x,nv1y,nv1z), fmt_v(nv2x,nv2y,nv2z), fmt_v(nv3x,nv3y,nv3z)
+    # Flip Texture Params
+    new_rot = -rot
+    new_off_x = -off_x if flip_x else off_x
+    new_off_y = -off_y if flip_y else off_y
+    tex_size = texture_sizes.get(tex_name.lower())
+    if tex_size and tex_size[0] and tex_size[1]:
+        # Wrap mirrored offsets into [0, size); same alignment, no huge negatives
+        if flip_x: new_off_x = new_off_x % tex_size[0]
+        if flip_y: new_off_y = new_off_y % tex_size[1]
+    new_scale_x, new_scale_y = scale_x, scale_y
+    tex_info_str = (f"{tex_name} {format_num(new_off_x)} {format_num(new_off_y)} "
+                    f"{format_num(new_rot)} {format_num(new_scale_x)} {format_num(new_scale_y)}{extra}")
+    # Reconstruct Line
+    if reverse_winding: return f" ( {v1_str} ) ( {v3_str} ) ( {v2_str} ) {tex_info_str}\n"
+    else: return f" ( {v1_str} ) ( {v2_str} ) ( {v3_str} ) {tex_info_str}\n"
+
+class _NumFormatCache(dict):
+    """format_num memoized per distinct value; map coordinates repeat a lot."""
+    def __missing__(self, val):
+        text = self[val] = format_num(val)
+        return text
+
+MEMO_DEFAULT_SIZE = 65536
+
+class _LineMemo:
+    """Bounded LRU memo from raw input line to flipped output, one functools.lru_cache per
+    wrapped rule. Copy-pasted brushes and prefabs repeat whole face and key lines."""
+
+    def __init__(self, size):
+        self.size = size
+        self._cached = []
+        self._hits = self._misses = 0 # From before the last clear()
+
+    def wrap(self, func):
+        cached = functools.lru_cache(maxsize=self.size)(func)
+        self._cached.append(cached)
+        return cached
+
+    def clear(self):
+        for cached in self._cached:
+            info = cached.cache_info()
+            self._hits += info.hits
+            self._misses += info.misses
+            cached.cache_clear()
+
+    def stats(self):
+        infos = [cached.cache_info() for cached in self._cached]
+        hits = self._hits + sum(info.hits for info in infos)
+        misses = self._misses + sum(info.misses for info in infos)
+        return {"memo_size": self.size, "memo_hits": hits, "memo_misses": misses,
+                "memo_hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0}
+
+def _flip_plane_multi(plane, configs, texture_sizes, fmt):
+    """_flip_plane for several configs at once. Each number is formatted at most twice
+    (as-is and negated) no matter how many configs there are."""
+    verts, tex_name, off_x, off_y, rot, scale_x, scale_y, extra = plane
+    pos = [fmt[v] for v in verts]
+    neg = [fmt[-v] for v in verts]
+    tex_size = texture_sizes.get(tex_name.lower())
+    new_off_x, new_off_y = -off_x, -off_y
+    if tex_size and tex_size[0] and tex_size[1]:
+        new_off_x, new_off_y = new_off_x % tex_size[0], new_off_y % tex_size[1]
+    off_x_strs = (fmt[off_x], fmt[new_off_x])
+    off_y_strs = (fmt[off_y], fmt[new_off_y])
+    rot_scale_str = f"{fmt[-rot]} {fmt[scale_x]} {fmt[scale_y]}{extra}\n"
+    out = []
+    for flip_x, flip_y, flip_z, reverse_winding in configs:
+        sx = neg if flip_x else pos
+        sy = neg if flip_y else pos
+        sz = neg if flip_z else pos
+        v1_str = f"{sx[0]} {sy[1]} {sz[2]}"
+        v2_str = f"{sx[3]} {sy[4]} {sz[5]}"
+        v3_str = f"{sx[6]} {sy[7]} {sz[8]}"
+        tex_info_str = f"{tex_name} {off_x_strs[flip_x]} {off_y_strs[flip_y]} {rot_scale_str}"
+        if reverse_winding: out.append(f" ( {v1_str} ) ( {v3_str} ) ( {v2_str} ) {tex_info_str}")
+        else: out.append(f" ( {v1_str} ) ( {v2_str} ) ( {v3_str} ) {tex_info_str}")
+    return out
+
+def _retexture_plane(plane, tex_name, adjust_x, adjust_y, flip_x, flip_y):
+    """_parse_plane output with another texture. The offset adjustment is meant for the
+    flipped face, so it is applied in reverse on axes the flip will negate."""
+    verts, _, off_x, off_y, rot, scale_x, scale_y, extra = plane
+    off_x = off_x - adjust_x if flip_x else off_x + adjust_x
+    off_y = off_y - adjust_y if flip_y else off_y + adjust_y
+    return verts, tex_name, off_x, off_y, rot, scale_x, scale_y, extra
+
+def _flip_point(x, y, z, flip_x, flip_y, flip_z):
+    return (-x if flip_x else x, -y if flip_y else y, -z if flip_z else z)
+
+def _flip_points_str(verts, flip_x, flip_y, flip_z, reverse_winding):
+    """The three flipped "( x y z )" groups of a face, in the right winding order."""
+    fmt_v = lambda x,y,z: " ".join(map(format_num, _flip_point(x, y, z, flip_x, flip_y, flip_z)))
+    v1_str, v2_str, v3_str = fmt_v(*verts[0:3]), fmt_v(*verts[3:6]), fmt_v(*verts[6:9])
+    if reverse_winding: return f"( {v1_str} ) ( {v3_str} ) ( {v2_str} )"
+    else: return f"( {v1_str} ) ( {v2_str} ) ( {v3_str} )"
+
+def _parse_valve_plane(plane_match):
+    """(9 vertex coords, tex_name, U axis + offset, V axis + offset, rot, scale_x, scale_y, extra)."""
+    verts = tuple(map(float, plane_match.group(1, 2, 3, 4, 5, 6, 7, 8, 9)))
+    u_axis = tuple(map(float, plane_match.group(11, 12, 13, 14)))
+    v_axis = tuple(map(float, plane_match.group(15, 16, 17, 18)))
+    rot, scale_x, scale_y = map(float, plane_match.group(19, 20, 21))
+    return verts, plane_match.group(10), u_axis, v_axis, rot, scale_x, scale_y, plane_match.group(22)
+
+def _retexture_valve_plane(plane, tex_name, adjust_x, adjust_y, flip_x, flip_y):
+    """_parse_valve_plane output with another texture; Valve offsets survive the flip as is."""
+    verts, _, (ux, uy, uz, u_off), (vx, vy, vz, v_off), rot, scale_x, scale_y, extra = plane
+    return verts, tex_name, (ux, uy, uz, u_off + adjust_x), (vx, vy, vz, v_off + adjust_y), rot, scale_x, scale_y, extra
+
+def _flip_valve_plane(plane, flip_x, flip_y, flip_z, reverse_winding, texture_sizes):
+    """Valve 220 faces carry their texture axes, so the axes are mirrored with the geometry
+    and offsets stay put; no heuristic needed."""
+    verts, tex_name, (ux, uy, uz, u_off), (vx, vy, vz, v_off), rot, scale_x, scale_y, extra = plane
+    ux, uy, uz = _flip_point(ux, uy, uz, flip_x, flip_y, flip_z)
+    vx, vy, vz = _flip_point(vx, vy, vz, flip_x, flip_y, flip_z)
+    u_str = " ".join(map(format_num, (ux, uy, uz, u_off)))
+    v_str = " ".join(map(format_num, (vx, vy, vz, v_off)))
+    return (f" {_flip_points_str(verts, flip_x, flip_y, flip_z, reverse_winding)} {tex_name} [ {u_str} ] [ {v_str} ] "
+            f"{format_num(rot)} {format_num(scale_x)} {format_num(scale_y)}{extra}\n")
+
+# --- Specialized Kernels ---
+# For the common single-config flip, each axis combination gets its own face and origin
+# function, generated from source once and cached: the flip tests and winding swap are
+# decided when the code is written, not on every coordinate of every face. Kernels work
+# on the regex match directly and format through per-run token caches (see
+# _TokenFormatCache), so repeated coordinates are never re-parsed or re-formatted.
+# Output is identical to dialect.flip(dialect.parse(match), ...).
+_KERNELS = {}
+_POINT_NAMES = ("v1x", "v1y", "v1z", "v2x", "v2y", "v2z", "v3x", "v3y", "v3z")
+
+class _TokenFormatCache(dict):
+    """Number text -> format_num of it (or of its negation); one of each per run."""
+    def __init__(self, negate):
+        super().__init__()
+        self.sign = -1.0 if negate else 1.0
+
+    def __missing__(self, token):
+        text = self[token] = format_num(self.sign * float(token))
+        return text
+
+def _kernel_points(flip_x, flip_y, flip_z):
+    """f-string source of the three flipped "( x y z )" groups, in the flipped winding order."""
+    flips = (flip_x, flip_y, flip_z)
+    point = lambda i: " ".join("{%s[%s]}" % ("neg" if flips[axis] else "pos", _POINT_NAMES[i * 3 + axis])
+                               for axis in range(3))
+    order = (0, 2, 1) if sum(flips) % 2 else (0, 1, 2)
+    return " ".join("( %s )" % point(i) for i in order)
+
+def _standard_kernel_source(flip_x, flip_y, flip_z, groups):
+    """Kernel for _parse_plane/_flip_plane faces (Quake, Quake 2, Daikatana)."""
+    extra = ", extra" if groups >= 16 else ""
+    src = [f"def kernel(m, texture_sizes, pos, neg):",
+           f"    {', '.join(_POINT_NAMES)}, tex_name, off_x, off_y, rot, scale_x, scale_y{extra} = "
+           f"m.group(*range(1, {17 if extra else 16}))"]
+    if flip_x or flip_y: # Mirrored offsets wrap into the texture size when it is known
+        src += ["    tex_size = texture_sizes.get(tex_name.lower()) if texture_sizes else None",
+                "    if tex_size and tex_size[0] and tex_size[1]:"]
+        src += ["        off_x = format_num(-float(off_x) % tex_size[0])"] if flip_x else []
+        src += ["        off_y = format_num(-float(off_y) % tex_size[1])"] if flip_y else []
+        src += ["    else:"]
+        src += ["        off_x = neg[off_x]"] if flip_x else []
+        src += ["        off_y = neg[off_y]"] if flip_y else []
+    src += ["    off_x = pos[off_x]"] if not flip_x else []
+    src += ["    off_y = pos[off_y]"] if not flip_y else []
+    src += [f'    return f" {_kernel_points(flip_x, flip_y, flip_z)} {{tex_name}} {{off_x}} {{off_y}} '
+            f'{{neg[rot]}} {{pos[scale_x]}} {{pos[scale_y]}}{"{extra}" if extra else ""}\\n"']
+    return "\n".join(src)
+
+def _valve_kernel_source(flip_x, flip_y, flip_z, groups):
+    """Kernel for Valve 220 faces: texture axes flip with the geometry, offsets stay."""
+    flips = (flip_x, flip_y, flip_z)
+    axis = lambda name: " ".join("{%s[%s%s]}" % ("neg" if flips[i] else "pos", name, "xyz"[i]) for i in range(3))
+    return "\n".join([
+        f"def kernel(m, texture_sizes, pos, neg):",
+        f"    {', '.join(_POINT_NAMES)}, tex_name, ux, uy, uz, u_off, vx, vy, vz, v_off, rot, scale_x, scale_y, "
+        f"extra = m.group(*range(1, 23))",
+        f'    return f" {_kernel_points(flip_x, flip_y, flip_z)} {{tex_name}} [ {axis("u")} {{pos[u_off]}} ] '
+        f'[ {axis("v")} {{pos[v_off]}} ] {{pos[rot]}} {{pos[scale_x]}} {{pos[scale_y]}}{{extra}}\\n"'])
+
+def _origin_kernel_source(flip_x, flip_y, flip_z):
+    """Kernel for "origin" key lines matched by entity_origin_re."""
+    coords = " ".join("{%s[m.group(%d)]}" % ("neg" if flip else "pos", group)
+                      for flip, group in zip((flip_x, flip_y, flip_z), (3, 4, 5)))
+    return "\n".join([f"def kernel(m, pos, neg):",
+                      f"    return f'\\t{{m.group(1)}} \"{coords}\"\\n'"])
+
+def _compile_kernel(key, source):
+    """Compiles generated kernel source once per key."""
+    kernel = _KERNELS.get(key)
+    if kernel is None:
+        namespace = {"format_num": format_num}
+        exec(compile(source, f"<kernel {key}>", "exec"), namespace)
+        kernel = _KERNELS[key] = namespace["kernel"]
+    return kernel
+
+def origin_kernel(flip_x, flip_y, flip_z):
+    """kernel(origin_match, pos, neg) -> flipped origin line, for one axis combination."""
+    flips = (bool(flip_x), bool(flip_y), bool(flip_z))
+    return _compile_kernel(("origin", *flips), _origin_kernel_source(*flips))
+
+class MapDialect:
+    """Face grammar for one .map flavour: a regex plus how to parse and flip a matched face.
+
+    Parsed faces always start with the 9 vertex coordinates, so brush hashing works for
+    every dialect, and group 10 of every face grammar is the texture name.
+    """
+
+    def __init__(self, name, face_re, parse, flip, retexture, flip_multi=None, kernel_source=None):
+        self.name = name
+        self.face_re = face_re
+        self.parse = parse
+        self.flip = flip
+        self.retexture = retexture
+        self._flip_multi = flip_multi
+        self._kernel_source = kernel_source
+
+    def kernel(self, flip_x, flip_y, flip_z):
+        """kernel(match, texture_sizes, pos, neg) -> flipped face line for one axis
+        combination, or None if this dialect has no generated kernel."""
+        if not self._kernel_source:
+            return None
+        flips = (bool(flip_x), bool(flip_y), bool(flip_z))
+        return _compile_kernel((self.name, *flips), self._kernel_source(*flips, self.face_re.groups))
+
+    def flip_multi(self, plane, configs, texture_sizes, fmt):
+        if self._flip_multi:
+            return self._flip_multi(plane, configs, texture_sizes, fmt)
+        return [self.flip(plane, *config, texture_sizes) for config in configs]
+
+    def __repr__(self):
+        return f"MapDialect({self.name!r})"
+
+# Detection order matters: the most specific grammar that matches the first face wins.
+MAP_DIALECTS = {
+    "valve220": MapDialect("valve220", plane_re_valve, _parse_valve_plane, _flip_valve_plane, _retexture_valve_plane,
+                           kernel_source=_valve_kernel_source),
+    "quake": MapDialect("quake", plane_re, _parse_plane, _flip_plane, _retexture_plane, _flip_plane_multi,
+                        _standard_kernel_source),
+    "quake2": MapDialect("quake2", plane_re_quake2, _parse_plane, _flip_plane, _retexture_plane, _flip_plane_multi,
+                         _standard_kernel_source),
+    # Only detected when the first face has a colour; otherwise use --dialect daikatana
+    "daikatana": MapDialect("daikatana", plane_re_daikatana, _parse_plane, _flip_plane, _retexture_plane,
+                            _flip_plane_multi, _standard_kernel_source),
+}
+# Quake 3 maps use the Quake 2 face grammar; brushDef/patchDef2 blocks are handled for every dialect.
+MAP_DIALECTS["quake3"] = MAP_DIALECTS["quake2"]
+DIALECT_AUTO = "auto"
+
+def get_dialect(dialect):
+    """MapDialect for a name, None for auto-detection."""
+    if dialect is None or isinstance(dialect, MapDialect):
+        return dialect
+    if dialect == DIALECT_AUTO:
+        return None
+    try:
+        return MAP_DIALECTS[dialect.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown map dialect: {dialect}. Choose from: {', '.join(MAP_DIALECTS)}")
+
+def detect_face_dialect(line):
+    """The dialect whose face grammar matches this (first) face line; Quake if none do."""
+    for dialect in MAP_DIALECTS.values():
+        if dialect.face_re.match(line):
+            return dialect
+    return MAP_DIALECTS["quake"]
+
+def match_face(dialect, line):
+    """Matches a face line with the file's dialect, then with the other grammars (Quake 2
+    editors mix faces with and without surface fields). Returns (dialect, match or None)."""
+    plane_match = dialect.face_re.match(line)
+    if plane_match:
+        return dialect, plane_match
+    for other in MAP_DIALECTS.values():
+        if other is not dialect:
+            plane_match = other.face_re.match(line)
+            if plane_match:
+                return other, plane_match
+    return dialect, None
+
+def detect_map_dialect(lines):
+    """Sniffs the first plain brush face in map lines. Faces and control points inside
+    Quake 3 brushDef/patchDef blocks sit a level deeper and are skipped."""
+    depth = 0
+    for line in lines:
+        stripped = line.strip()
+        if stripped == "{":
+            depth += 1
+        elif stripped == "}":
+            depth = max(0, depth - 1)
+        elif depth == 2 and stripped.startswith("("):
+            return detect_face_dialect(line)
+    return MAP_DIALECTS["quake"]
+
+def _flip_block_line(block_kind, line, flip_x, flip_y, flip_z, reverse_winding):
+    """Flips a line inside a Quake 3 brushDef/patchDef block; None if it is left alone."""
+    if block_kind == "brushDef":
+        face_match = plane_re_brushdef.match(line)
+        if not face_match:
+            return None
+        verts = tuple(map(float, face_match.group(1, 2, 3, 4, 5, 6, 7, 8, 9)))
+        # The texture matrix is relative to the plane and is kept as is
+        return f" {_flip_points_str(verts, flip_x, flip_y, flip_z, reverse_winding)} {face_match.group(10)}\n"
+    if block_kind.startswith("patchDef") and line.lstrip().startswith("( ("):
+        points = []
+        for point_match in patch_point_re.finditer(line):
+            x, y, z, u, v = map(float, point_match.groups())
+            points.append(" ".join(map(format_num, (*_flip_point(x, y, z, flip_x, flip_y, flip_z), u, v))))
+        if reverse_winding:
+            points.reverse() # Keep the patch facing outwards
+        indent = line[:len(line) - len(line.lstrip())]
+        return indent + "( " + " ".join(f"( {point} )" for point in points) + " )\n"
+    return None
+
+def _flip_brush_lines(brush_lines, dialect, flip_x, flip_y, flip_z, reverse_winding, texture_sizes, texture_map=None):
+    """Flips the inner lines of one brush block (faces, or a nested Quake 3 block)."""
+    out = []
+    block_kind = None
+    for line in brush_lines:
+        stripped = line.strip()
+        if block_kind:
+            flipped = _flip_block_line(block_kind, line, flip_x, flip_y, flip_z, reverse_winding)
+            out.append(flipped if flipped is not None else line)
+            continue
+        face_dialect, plane_match = match_face(dialect, line)
+        if plane_match:
+            plane = face_dialect.parse(plane_match)
+            if texture_map:
+                plane = _remap_texture(face_dialect, plane, texture_map, flip_x, flip_y)
+            out.append(face_dialect.flip(plane, flip_x, flip_y, flip_z, reverse_winding, texture_sizes))
+            continue
+        if stripped in ("brushDef", "patchDef2", "patchDef3"):
+            block_kind = stripped
+        out.append(line)
+    return out
+
+def flip_map_lines_multi(lines, configs, wad_dirs=None, cache_dir=None,
+                         progress=None, cancel=None, total_bytes=None, progress_interval=0.1, dialect=None,
+                         texture_map=None, memo_size=0, stats=None, prefabs=None):
+    """Flips a .map once for several (flip_x, flip_y, flip_z) configs, sharing the parse.
+
+    Yields each input line as-is when no config changes it, otherwise a list with one
+    output line per config. See flip_map_lines for the other arguments.
+    """
+    configs = [(bool(fx), bool(fy), bool(fz), sum([fx, fy, fz]) % 2 != 0) for fx, fy, fz in configs]
+    fan_out = len(configs) > 1
+    fmt = _NumFormatCache()
+    brace_level = 0
+    in_brush = False
+    current_classname = None # Added: Track current entity classname
+    texture_sizes = {} # Filled from the worldspawn "wad" key
+    dialect = get_dialect(dialect) # None: detected from the first face
+    block_kind = None # Quake 3 brushDef/patchDef block being read
+    # Single flips go through the generated kernels for their axis combination
+    kernel_for = lambda dialect: dialect.kernel(*configs[0][:3]) if dialect and not fan_out else None
+    face_kernel = kernel_for(dialect)
+    flip_origin = None if fan_out else origin_kernel(*configs[0][:3])
+    pos, neg = _TokenFormatCache(False), _TokenFormatCache(True)
+
+    def flip_face(line):
+        # Output depends only on the line once dialect, texture sizes and configs are set
+        plane_match = dialect.face_re.match(line)
+        if not plane_match:
+            face_dialect, plane_match = match_face(dialect, line) # A face in another grammar
+            return flip_plane(face_dialect, plane_match) if plane_match else None
+        if face_kernel and not (texture_map and plane_match.group(10).lower() in texture_map):
+            return [face_kernel(plane_match, texture_sizes, pos, neg)]
+        return flip_plane(dialect, plane_match)
+
+    def flip_plane(face_dialect, plane_match):
+        plane = face_dialect.parse(plane_match)
+        remap = texture_map.get(plane[1].lower()) if texture_map else None
+        if remap: return [face_dialect.flip(face_dialect.retexture(plane, *remap, fx, fy), fx, fy, fz, rw, texture_sizes)
+                          for fx, fy, fz, rw in configs]
+        if fan_out: return face_dialect.flip_multi(plane, configs, texture_sizes, fmt)
+        return [face_dialect.flip(plane, *configs[0], texture_sizes)]
+
+    def flip_key_line(line, classname):
+        if classname in PREFAB_CLASSNAMES:
+            kind, match = _match_prefab_line(line, classname)
+            if kind == "file":
+                return [f'	{match.group(1)} "{prefabs.reference(match.group(3), fx, fy, fz)}"\n'
+                        for fx, fy, fz, _ in configs]
+            if kind:
+                return [_flip_prefab_rotation(kind, match, fx, fy, fz) for fx, fy, fz, _ in configs]
+        kind, match = _match_entity_line(line, classname)
+        if kind == "origin" and flip_origin:
+            return [flip_origin(match, pos, neg)]
+        return [_flip_entity_line(kind, match, fx, fy, fz) for fx, fy, fz, _ in configs] if kind else None
+
+    rule_classnames = _CLASSNAME_RULES | PREFAB_CLASSNAMES if prefabs else _CLASSNAME_RULES
+    memo = _LineMemo(memo_size) if memo_size else None
+    if memo:
+        flip_face, flip_key_line = memo.wrap(flip_face), memo.wrap(flip_key_line)
+
+    bytes_done = 0
+    next_progress_at = PROGRESS_BYTE_STEP if progress else float('inf')
+    last_progress = time.perf_counter()
+
+    line_num = 0
+    for line in lines:
+        line_num += 1
+        bytes_done += len(line)
+        if bytes_done >= next_progress_at:
+            next_progress_at = bytes_done + PROGRESS_BYTE_STEP
+            now = time.perf_counter()
+            if now - last_progress >= progress_interval:
+                last_progress = now
+                progress(bytes_done, total_bytes)
+        stripped_line = line.strip()
+
+        # Preserve empty/comment lines
+        if not stripped_line or stripped_line.startswith("//"):
+            yield line
+            continue
+
+        # Track brace levels and reset classname on entity start/end
+        if stripped_line == "{":
+            brace_level += 1
+            if brace_level == 1: current_classname = None # Reset on new entity
+            if brace_level == 2: in_brush = True
+            # Worldspawn can be most of the file, so brush starts count as boundaries too
+            if cancel is not None and brace_level <= 2 and cancel.cancelled:
+                raise FlipCancelled(f"Cancelled at line {line_num}")
+            yield line
+            continue
+        elif stripped_line == "}":
+            if brace_level == 2: in_brush = False
+            brace_level = max(0, brace_level - 1)
+            if brace_level == 0: current_classname = None # Exiting top-level entity
+            if brace_level <= 2: block_kind = None
+            yield line
+            continue
+
+        # --- Process Entity Properties (when not inside a brush, level 1) ---
+        if not in_brush and brace_level == 1:
+            # --- Get Classname (should be the first property) ---
+            if current_classname is None: # Only check if not already found
+                classname_match = entity_classname_re.match(line)
+                if classname_match:
+                    current_classname = classname_match.group(3)
+
+            # Only worldspawn, trigger_changelevel and (with prefabs) instances have classname-specific rewrites
+            flipped = flip_key_line(line, current_classname if current_classname in rule_classnames else None)
+            if flipped:
+                yield flipped
+                continue
+            if current_classname == "worldspawn" and wad_dirs is not None:
+                wad_match = entity_wad_re.match(line)
+                if wad_match:
+                    texture_sizes = texture_sizes_for_wad_key(wad_match.group(3), wad_dirs, cache_dir)
+                    if memo: memo.clear() # Memoized faces were flipped with the old sizes
+
+        # --- Process Brush Plane (when inside a brush, level 2) ---
+        elif in_brush and brace_level == 2:
+            if dialect is None and stripped_line.startswith("("):
+                dialect = detect_face_dialect(line) # Once per file, from the first face
+                face_kernel = kernel_for(dialect)
+            if dialect:
+                try:
+                    flipped = flip_face(line)
+                    if flipped:
+                        yield flipped
+                        continue
+                    if stripped_line.startswith("("):
+                        print(f"Warning: Unrecognised face line {line_num}: {stripped_line}. Copied unflipped.")
+                except ValueError as e: print(f"Warning: Plane parse error line {line_num}: {stripped_line}. {e}")
+                except Exception as e: print(f"Warning: Plane process error line {line_num}: {stripped_line}. {e}")
+            if stripped_line in ("brushDef", "patchDef2", "patchDef3"):
+                block_kind = stripped_line # Quake 3 block; its lines are one level deeper
+
+        # --- Process Quake 3 brushDef/patchDef lines (level 3) ---
+        elif block_kind and brace_level == 3:
+            flipped = [_flip_block_line(block_kind, line, *config) for config in configs]
+            if flipped[0] is not None:
+                yield flipped
+                continue
+
+        # Unchanged line
+        yield line
+
+    if progress:
+        progress(bytes_done, total_bytes or bytes_done)
+    if stats is not None:
+        stats["lines"] = line_num
+        if memo:
+            stats.update(memo.stats())
+
+def flip_map_lines(lines, flip_x, flip_y, flip_z, wad_dirs=None, cache_dir=None,
+                   progress=None, cancel=None, total_bytes=None, progress_interval=0.1, dialect=None,
+                   texture_map=None, memo_size=0, stats=None, prefabs=None):
+    """Yields the flipped version of each line of a .map file.
+
+    wad_dirs: directories to look for the worldspawn WADs in. None skips the lookup.
+    progress: called as progress(bytes_done, total_bytes), at most every progress_interval seconds.
+    cancel: a CancelToken; FlipCancelled is raised at the next entity or brush start once cancelled.
+    dialect: a MAP_DIALECTS name or MapDialect; None/"auto" detects it from the first face.
+    texture_map: {lowercase source name: (replacement, offset_x, offset_y)}, see load_texture_map.
+    memo_size: keep up to this many flipped face and key lines per rule in an LRU memo (0: off).
+    stats: a dict to fill with the line count and, with the memo on, its hits, misses and hit rate.
+    prefabs: a PrefabStore; misc_external_map / func_instance entities are pointed at flipped
+    copies of their prefabs and their rotation is mirrored to match. None leaves them as any entity.
+    """
+    for out in flip_map_lines_multi(lines, [(flip_x, flip_y, flip_z)], wad_dirs, cache_dir,
+                                    progress, cancel, total_bytes, progress_interval, dialect, texture_map,
+                                    memo_size, stats, prefabs):
+        yield out if out.__class__ is str else out[0]
+
+
+# --- Selective Transform (skip-scanning) ---
+# With a filter, untouched entities and brushes are copied as raw slices of the file. Only
+# brace lines are visited to find where blocks end; skipped text gets no regex or float work.
+brace_line_re = re.compile(r'^[ \t]*([{}])[ \t]*$', re.M)
+classname_search_re = re.compile(r'^\s*"classname"\s*"([^"]*)"', re.M)
+wad_search_re = re.compile(r'^\s*"wad"\s*"([^"]*)"', re.M)
+
+def _flip_key_region(region, classname, flip_x, flip_y, flip_z):
+    out = []
+    for line in region.splitlines(keepends=True):
+        kind, match = _match_entity_line(line, classname)
+        out.append(_flip_entity_line(kind, match, flip_x, flip_y, flip_z) if kind else line)
+    return "".join(out)
+
+def flip_map_text_selective(text, flip_x, flip_y, flip_z, entities=True, brushes=True, classnames=None,
+                            wad_dirs=None, cache_dir=None, progress=None, cancel=None, progress_interval=0.1,
+                            dialect=None, texture_map=None):
+    """Yields output chunks for a flip restricted to entity keys, brushes and/or classnames.
+
+    entities / brushes: whether key lines / brush faces are transformed.
+    classnames: if given, only entities with one of these classnames are touched.
+    """
+    reverse_winding = sum([flip_x, flip_y, flip_z]) % 2 != 0
+    dialect = get_dialect(dialect) or detect_map_dialect(io.StringIO(text))
+    texture_sizes = {}
+    pos = 0 # Everything before pos has been yielded
+    depth = 0
+    selected = False
+    key_start = brush_start = None # key_start is None once the key region is handled
+    last_progress = time.perf_counter()
+
+    def keys_done(key_end):
+        # Classname and wad are looked up only in the small key region of each entity.
+        # Worldspawn's WADs are loaded even when it isn't selected: the selected brushes use them.
+        nonlocal selected, texture_sizes
+        region = text[key_start:key_end]
+        classname_match = classname_search_re.search(region)
+        classname = classname_match.group(1) if classname_match else None
+        selected = classnames is None or classname in classnames
+        if brushes and wad_dirs is not None and classname == "worldspawn":
+            wad_match = wad_search_re.search(region)
+            if wad_match:
+                texture_sizes = texture_sizes_for_wad_key(wad_match.group(1), wad_dirs, cache_dir)
+        if selected and entities:
+            return _flip_key_region(region, classname, flip_x, flip_y, flip_z)
+        return None
+
+    for brace_match in brace_line_re.finditer(text):
+        line_end = brace_match.end() + 1
+        if brace_match.group(1) == "{":
+            depth += 1
+            if depth == 1:
+                if cancel is not None and cancel.cancelled:
+                    raise FlipCancelled(f"Cancelled at offset {brace_match.start()}")
+                if progress and time.perf_counter() - last_progress >= progress_interval:
+                    last_progress = time.perf_counter()
+                    progress(brace_match.start(), len(text))
+                key_start = line_end
+            elif depth == 2:
+                if key_start is not None:
+                    flipped = keys_done(brace_match.start())
+                    if flipped is not None:
+                        yield text[pos:key_start]
+                        yield flipped
+                        pos = brace_match.start()
+                    key_start = None
+                brush_start = line_end
+        else:
+            if depth == 2 and selected and brushes:
+                yield text[pos:brush_start]
+                brush_lines = text[brush_start:brace_match.start()].splitlines(keepends=True)
+                yield "".join(_flip_brush_lines(brush_lines, dialect, flip_x, flip_y, flip_z,
+                                                reverse_winding, texture_sizes, texture_map))
+                pos = brace_match.start()
+            elif depth == 1 and key_start is not None: # Point entity: keys run up to the closing brace
+                flipped = keys_done(brace_match.start())
+                if flipped is not None:
+                    yield text[pos:key_start]
+                    yield flipped
+                    pos = brace_match.start()
+                key_start = None
+            depth = max(0, depth - 1)
+    yield text[pos:]
+    if progress:
+        progress(len(text), len(text))
+
+
+# --- Pipelined I/O ---
+# Reader thread -> transform (calling thread) -> writer thread, with ~1 MB chunks of
+# lines passed through small bounded queues. Disk and network waits release the GIL,
+# so on slow storage they overlap with the flip instead of adding to it, and at most
+# a few chunks per queue are ever held in memory.
+PIPELINE_CHUNK_BYTES = 1 << 20
+PIPELINE_QUEUE_CHUNKS = 4
+_PIPELINE_POLL = 0.1 # Seconds between checks for a failed or stopped stage
+
+def run_io_pipeline(infile, outfile, transform, chunk_bytes=PIPELINE_CHUNK_BYTES, queue_chunks=PIPELINE_QUEUE_CHUNKS):
+    """Writes transform(lines of infile) to outfile with reading and writing on their own
+    threads. transform takes an iterable of lines and returns an iterable of strings.
+    An error in any stage stops the others and is raised here."""
+    read_queue = queue.Queue(queue_chunks)
+    write_queue = queue.Queue(queue_chunks)
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_PIPELINE_POLL)
+                return True
+            except queue.Full:
+                pass
         return False
 
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_PIPELINE_POLL)
+            except queue.Empty:
+                pass
+        return None
+
+    def reader():
+        try:
+            while True:
+                chunk = infile.readlines(chunk_bytes)
+                if not put(read_queue, chunk) or not chunk: # [] marks the end of the file
+                    return
+        except BaseException as e:
+            errors.append(e)
+            put(read_queue, None)
+
+    def writer():
+        try:
+            while True:
+                chunk = get(write_queue)
+                if chunk is None:
+                    return
+                outfile.write(chunk)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def input_lines():
+        while True:
+            chunk = get(read_queue)
+            if chunk is None:
+                raise errors[0] if errors else FlipCancelled("Pipeline stopped")
+            if not chunk:
+                return
+            yield from chunk
+
+    threads = [threading.Thread(target=reader, name="map-reader", daemon=True),
+               threading.Thread(target=writer, name="map-writer", daemon=True)]
+    for thread in threads:
+        thread.start()
     try:
-        with open(input_path, 'r') as infile, open(output_path, 'w') as outfile:
-            brace_level = 0
-            in_brush = False
-            current_classname = None # Added: Track current entity classname
-            flip_axis_count = sum([flip_x, flip_y, flip_z])
-            reverse_winding = (flip_axis_count % 2 != 0)
-
-            line_num = 0
-            for line in infile:
-                line_num += 1
-                stripped_line = line.strip()
-                processed_line = line # Default to original line
-
-                # Preserve empty/comment lines
-                if not stripped_line or stripped_line.startswith("//"):
-                    outfile.write(processed_line)
-                    continue
+        out, size = [], 0
+        for text in transform(input_lines()):
+            out.append(text)
+            size += len(text)
+            if size >= chunk_bytes:
+                if not put(write_queue, "".join(out)):
+                    break
+                out, size = [], 0
+        else:
+            if not out or put(write_queue, "".join(out)):
+                put(write_queue, None)
+                threads[1].join()
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
 
-                # Track brace levels and reset classname on entity start/end
-                if stripped_line == "{":
-                    brace_level += 1
-                    if brace_level == 1: current_classname = None # Reset on new entity
-                    if brace_level == 2: in_brush = True
-                    outfile.write(processed_line)
-                    continue
-                elif stripped_line == "}":
-                    if brace_level == 2: in_brush = False
-                    # Reset classname *after* processing potential end brace of level 1 entity
-                    # No, reset should happen when brace_level drops *to* 0, handled implicitly by next loop
-                    brace_level = max(0, brace_level - 1)
-                    if brace_level == 0: current_classname = None # Exiting top-level entity
-                    outfile.write(processed_line)
-                    continue
+class _DelayedRawIO(io.RawIOBase):
+    """Raw file wrapper that sleeps in proportion to the bytes moved, to stand in for
+    slow network or compressed storage in benchmarks."""
 
-                line_processed = False # Flag to check if we handled the line
-
-                # --- Process Entity Properties (when not inside a brush, level 1) ---
-                if not in_brush and brace_level == 1:
-                    # --- Get Classname (should be the first property) ---
-                    if current_classname is None: # Only check if not already found
-                         classname_match = entity_classname_re.match(line)
-                         if classname_match:
-                             current_classname = classname_match.group(3)
-                             # Don't set line_processed=True yet, just store classname
-                             # and let the original line be written below if nothing else matches.
-
-                    # --- Worldspawn Message ---
-                    if current_classname == "worldspawn":
-                        message_match = entity_message_re.match(line)
-                        if message_match:
-                            key = message_match.group(1)
-                            value = message_match.group(3)
-                            new_value = value + " Flipped"
-                            processed_line = f'	{key} "{new_value}"\n' # Use tab for standard formatting
-                            line_processed = True
-
-                    # --- Trigger_Changelevel Map ---
-                    elif current_classname == "trigger_changelevel":
-                         map_match = entity_map_re.match(line)
-                         if map_match:
-                             key = map_match.group(1)
-                             value = map_match.group(3)
-                             new_value = value + "_flipped"
-                             processed_line = f'	{key} "{new_value}"\n' # Use tab
-                             line_processed = True
-
-                    # --- Origin ---
-                    # Check only if not already processed above
-                    if not line_processed:
-                        origin_match = entity_origin_re.match(line)
-                        if origin_match:
-                            key = origin_match.group(1)
-                            x, y, z = map(float, [origin_match.group(3), origin_match.group(4), origin_match.group(5)])
-                            new_x, new_y, new_z = (-x if flip_x else x, -y if flip_y else y, -z if flip_z else z)
-                            processed_line = f'	{key} "{format_num(new_x)} {format_num(new_y)} {format_num(new_z)}"\n'
-                            line_processed = True
-
-                    # --- Angle ---
-                    if not line_processed:
-                        angle_match = entity_angle_re.match(line)
-                        if angle_match:
-                            key = angle_match.group(1)
-                            current_angle = int(angle_match.group(3))
-                            new_angle = float(current_angle)
-                            if current_angle < 0: # Up/Down
-                                if flip_z: new_angle = -1.0 if current_angle == -2 else -2.0
-                            else: # Direction/Facing
-                                if flip_x: new_angle = 180.0 - new_angle
-                                if flip_y: new_angle = -new_angle
-                                new_angle = normalize_angle(new_angle)
-                            processed_line = f'	{key} "{int(round(new_angle))}"\n'
-                            line_processed = True
-
-                    # --- Angles (Pitch Yaw Roll) ---
-                    if not line_processed:
-                        angles_match = entity_angles_re.match(line)
-                        if angles_match:
-                            key = angles_match.group(1)
-                            pitch, yaw, roll = map(float, [angles_match.group(3), angles_match.group(4), angles_match.group(5)])
-                            new_pitch, new_yaw, new_roll = pitch, yaw, roll
-                            if flip_x: new_yaw, new_roll = 180.0 - new_yaw, -new_roll
-                            if flip_y: new_yaw, new_roll = -new_yaw, -new_roll
-                            if flip_z: new_pitch = -new_pitch
-                            new_yaw = normalize_angle(new_yaw)
-                            processed_line = f'	{key} "{format_num(new_pitch)} {format_num(new_yaw)} {format_num(new_roll)}"\n'
-                            line_processed = True
-
-                # --- Process Brush Plane (when inside a brush, level 2) ---
-                elif in_brush and brace_level == 2:
-                    plane_match = plane_re.match(line)
-                    if plane_match:
-                        try:
-                            # (Vertex and Texture processing logic - unchanged)
-                            v1x, v1y, v1z = map(float, plane_match.group(1, 2, 3))
-                            v2x, v2y, v2z = map(float, plane_match.group(4, 5, 6))
-                            v3x, v3y, v3z = map(float, plane_match.group(7, 8, 9))
-                            tex_name = plane_match.group(10)
-                            off_x, off_y, rot = map(float, plane_match.group(11, 12, 13))
-                            scale_x, scale_y = map(float, plane_match.group(14, 15))
-                            # Flip Vertices
-                            nv1x, nv1y, nv1z = (-v1x if flip_x else v1x, -v1y if flip_y else v1y, -v1z if flip_z else v1z)
-                            nv2x, nv2y, nv2z = (-v2x if flip_x else v2x, -v2y if flip_y else v2y, -v2z if flip_z else v2z)
-                            nv3x, nv3y, nv3z = (-v3x if flip_x else v3x, -v3y if flip_y else v3y, -v3z if flip_z else v3z)
-                            fmt_v = lambda x,y,z: " ".join(map(format_num, [x,y,z]))
-                            v1_str, v2_str, v3_str = fmt_v(nv1x,nv1y,nv1z), fmt_v(nv2x,nv2y,nv2z), fmt_v(nv3x,nv3y,nv3z)
-                            # Flip Texture Params
-                            new_rot = -rot
-                            new_off_x = -off_x if flip_x else off_x
-                            new_off_y = -off_y if flip_y else off_y
-                            new_scale_x, new_scale_y = scale_x, scale_y
-                            tex_info_str = (f"{tex_name} {format_num(new_off_x)} {format_num(new_off_y)} "
-                                            f"{format_num(new_rot)} {format_num(new_scale_x)} {format_num(new_scale_y)}")
-                            # Reconstruct Line
-                            if reverse_winding: processed_line = f" ( {v1_str} ) ( {v3_str} ) ( {v2_str} ) {tex_info_str}\n"
-                            else: processed_line = f" ( {v1_str} ) ( {v2_str} ) ( {v3_str} ) {tex_info_str}\n"
-                            line_processed = True # Mark plane line as processed
-                        except ValueError as e: print(f"Warning: Plane parse error line {line_num}: {stripped_line}. {e}")
-                        except Exception as e: print(f"Warning: Plane process error line {line_num}: {stripped_line}. {e}")
-
-                # Write the (potentially modified) line
-                outfile.write(processed_line)
+    def __init__(self, raw, seconds_per_mb):
+        self.raw = raw
+        self.seconds_per_mb = seconds_per_mb
 
-        return True
+    def readable(self): return self.raw.readable()
+    def writable(self): return self.raw.writable()
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        time.sleep(self.seconds_per_mb * (count or 0) / 1e6)
+        return count
+
+    def write(self, data):
+        time.sleep(self.seconds_per_mb * len(data) / 1e6)
+        return self.raw.write(data)
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+def _open_delayed(path, mode, seconds_per_mb):
+    raw = _DelayedRawIO(open(path, mode + 'b', buffering=0), seconds_per_mb)
+    buffered = io.BufferedReader(raw, 1 << 16) if mode == 'r' else io.BufferedWriter(raw, 1 << 16)
+    return io.TextIOWrapper(buffered)
+
+def benchmark_pipeline(input_path, flip_x=True, flip_y=False, flip_z=False, io_delay=0.1, repeat=1):
+    """Times the serial loop against run_io_pipeline for one flip, reading the map and
+    writing to os.devnull through storage slowed by io_delay seconds per MB each way.
+    Returns timings in seconds (best of repeat) and the speedup."""
+    size = os.path.getsize(input_path)
+    transform = lambda lines: flip_map_lines(lines, flip_x, flip_y, flip_z)
+    timings = {}
+    for mode in ("serial", "pipelined"):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with _open_delayed(input_path, 'r', io_delay) as infile, _open_delayed(os.devnull, 'w', io_delay) as outfile:
+                if mode == "serial":
+                    outfile.writelines(transform(infile))
+                else:
+                    run_io_pipeline(infile, outfile, transform)
+            best = min(best, time.perf_counter() - start)
+        timings[mode] = best
+    return {
+        "path": input_path,
+        "mb": round(size / 1e6, 2),
+        "io_delay_s_per_mb": io_delay,
+        "serial_s": round(timings["serial"], 3),
+        "pipelined_s": round(timings["pipelined"], 3),
+        "speedup": round(timings["serial"] / timings["pipelined"], 2),
+    }
+
+
+# --- Prefabs (misc_external_map / func_instance) ---
+# An instance places a prefab .map at its origin, rotated by its angles. Mirroring the
+# placed prefab is the same as mirroring the prefab in its own frame and conjugating the
+# rotation (M R M), so each prefab needs one flipped copy per axis combination, however
+# often and however rotated it is placed. Those copies are kept in memory and on disk by
+# content hash and written next to the flipped map; the instances are pointed at them.
+PREFAB_CACHE_VERSION = 2 # Bump when flipped prefab output changes, to retire old cache entries
+PREFAB_MEMO_BYTES = 32 * 1024 * 1024 # Flipped prefabs kept in memory; the disk cache holds the rest
+external_map_re = re.compile(r'^\s*("_external_map")\s*("([^"]*)")\s*$')
+external_map_angle_re = re.compile(r'^\s*("_external_map_angle")\s*("(-?\d+\.?\d*)")\s*$')
+external_map_angles_re = re.compile(
+    r'^\s*("_external_map_angles")\s*("(-?\d+\.?\d*)\s+(-?\d+\.?\d*)\s+(-?\d+\.?\d*)")\s*$')
+instance_file_re = re.compile(r'^\s*("file")\s*("([^"]*)")\s*$')
+# Prefab file and instance rotation keys per classname. misc_external_map hands its plain
+# "angle"/"angles" to the generated entity (a door's move direction), so those keep the usual rules.
+_PREFAB_KEYS = {
+    "misc_external_map": (("file", external_map_re), ("angle", external_map_angle_re),
+                          ("angles", external_map_angles_re)),
+    "func_instance": (("file", instance_file_re), ("angles", entity_angles_re)),
+}
+PREFAB_CLASSNAMES = frozenset(_PREFAB_KEYS)
+
+class _BytesLRU:
+    """LRU of bytes values, evicting the oldest once their total size passes max_bytes.
+    Long-lived processes (service workers) flip many map sets, so this must not grow forever."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = collections.OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if key in self._items:
+            self._bytes -= len(self._items.pop(key))
+        self._items[key] = value
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes and self._items:
+            self._bytes -= len(self._items.popitem(last=False)[1])
+
+_prefab_memo = _BytesLRU(PREFAB_MEMO_BYTES)
+
+def _axes_name(flip_x, flip_y, flip_z):
+    return "".join(a for a, on in zip("xyz", (flip_x, flip_y, flip_z)) if on)
+
+def prefab_output_name(reference, flip_x, flip_y, flip_z):
+    """Reference to the flipped copy of a prefab: prefabs/door.map -> prefabs/door_flipped_x.map."""
+    base, ext = os.path.splitext(reference)
+    return f"{base}_flipped_{_axes_name(flip_x, flip_y, flip_z)}{ext}"
+
+def _match_prefab_line(line, classname):
+    """Finds the prefab file or rotation key in an instance's key line. Returns (kind, match)."""
+    for kind, regex in _PREFAB_KEYS[classname]:
+        match = regex.match(line)
+        if match: return kind, match
+    return None, None
+
+def _flip_prefab_rotation(kind, match, flip_x, flip_y, flip_z):
+    """Conjugates an instance rotation by the mirror: the angle about each axis changes
+    sign once for every other axis that is flipped."""
+    key = match.group(1)
+    yaw_sign = -1.0 if flip_x != flip_y else 1.0
+    if kind == "angle":
+        return f'	{key} "{format_num(normalize_angle(yaw_sign * float(match.group(3))))}"\n'
+    pitch, yaw, roll = map(float, match.group(3, 4, 5))
+    if flip_x != flip_z: pitch = -pitch
+    if flip_y != flip_z: roll = -roll
+    return f'	{key} "{format_num(pitch)} {format_num(normalize_angle(yaw_sign * yaw))} {format_num(roll)}"\n'
+
+def iter_prefab_references(text):
+    """Yields the prefab file value of every instance entity in map text."""
+    for item in iter_map_entities(text.splitlines(True)):
+        if item.__class__ is str:
+            continue
+        classname = _entity_classname(item[0])
+        if classname not in PREFAB_CLASSNAMES:
+            continue
+        for line in item[0]:
+            kind, match = _match_prefab_line(line, classname)
+            if kind == "file":
+                yield match.group(3)
+
+class PrefabStore:
+    """Resolves instance references during a flip and writes each flipped prefab once.
+
+    source_dir: directory of the referencing map; relative references are looked up there,
+    then in search_dirs. output_dirs: {(flip_x, flip_y, flip_z): directory of the flipped map};
+    flipped prefabs keep their relative place under it (absolute references stay beside the
+    original). Prefabs are flipped without WAD lookups, so their texture offsets are not wrapped.
+    """
+
+    def __init__(self, source_dir, output_dirs, search_dirs=(), cache_dir=None, dialect=None, texture_map=None,
+                 _written=None, _stats=None):
+        self.source_dir = source_dir
+        self.output_dirs = {tuple(map(bool, config)): directory for config, directory in output_dirs.items()}
+        self.search_dirs = list(search_dirs)
+        self.cache_dir = cache_dir
+        self.dialect = get_dialect(dialect)
+        self.texture_map = texture_map
+        self.written = set() if _written is None else _written # Output paths done (or underway) this run
+        self.stats = dict.fromkeys(("prefab_references", "prefabs_flipped", "prefab_memory_hits",
+                                    "prefab_disk_hits"), 0) if _stats is None else _stats
+
+    def resolve(self, reference):
+        """Path of the prefab file a reference names."""
+        entry = reference.replace("\\", "/")
+        candidates = [entry] if os.path.isabs(entry) else [os.path.join(d, entry) for d in (self.source_dir, *self.search_dirs)]
+        path = next((c for c in candidates if os.path.isfile(c)), None)
+        if path is None:
+            raise ValueError(f"Prefab not found: {reference}")
+        return path
+
+    def reference(self, reference, flip_x, flip_y, flip_z):
+        """Makes sure the flipped copy of a referenced prefab exists; returns the new reference."""
+        config = (bool(flip_x), bool(flip_y), bool(flip_z))
+        self.stats["prefab_references"] += 1
+        path = self.resolve(reference)
+        new_reference = prefab_output_name(reference, *config)
+        entry = new_reference.replace("\\", "/")
+        output_path = os.path.abspath(entry if os.path.isabs(entry) else os.path.join(self.output_dirs[config], entry))
+        if output_path not in self.written:
+            self.written.add(output_path) # Before flipping, so prefabs that reference each other terminate
+            nested = PrefabStore(os.path.dirname(path), {config: os.path.dirname(output_path)}, self.search_dirs,
+                                 self.cache_dir, self.dialect, self.texture_map, self.written, self.stats)
+            data = nested.flip(path, *config)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            tmp_path = f"{output_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, output_path)
+        return new_reference
+
+    def _cache_key(self, data, config):
+        texture_map = sorted(self.texture_map.items()) if self.texture_map else None
+        dialect = self.dialect.name if self.dialect else DIALECT_AUTO
+        header = repr((PREFAB_CACHE_VERSION, config, dialect, texture_map)).encode()
+        return hashlib.sha1(header + b"\0" + data).hexdigest()
+
+    def flip(self, path, flip_x, flip_y, flip_z):
+        """Flipped bytes of the prefab at path, from memory, the disk cache, or a fresh flip.
+        Instances inside it are pointed at flipped copies written by this store."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = self._cache_key(data, (flip_x, flip_y, flip_z))
+        flipped = _prefab_memo.get(digest)
+        if flipped is not None:
+            self.stats["prefab_memory_hits"] += 1
+        else:
+            cache_path = os.path.join(self.cache_dir or default_cache_dir(), "prefab", f"{digest}.map")
+            try:
+                with open(cache_path, 'rb') as f:
+                    flipped = f.read()
+                self.stats["prefab_disk_hits"] += 1
+            except OSError:
+                flipped = flip_map_bytes(data, flip_x, flip_y, flip_z, dialect=self.dialect,
+                                         texture_map=self.texture_map, prefabs=self)
+                self.stats["prefabs_flipped"] += 1
+                try:
+                    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(flipped)
+                    os.replace(tmp_path, cache_path)
+                except OSError as e:
+                    print(f"Warning: Could not write prefab cache {cache_path}. {e}")
+                _prefab_memo.put(digest, flipped)
+                return flipped
+            _prefab_memo.put(digest, flipped)
+        # A cached copy already names its nested prefabs; make sure those are written too
+        for reference in iter_prefab_references(data.decode('latin-1')):
+            self.reference(reference, flip_x, flip_y, flip_z)
+        return flipped
+
+def _prefab_store(input_path, outputs, prefab_dirs, cache_dir, dialect, texture_map):
+    output_dirs = {(bool(fx), bool(fy), bool(fz)): os.path.dirname(os.path.abspath(path)) for path, fx, fy, fz in outputs}
+    if len(output_dirs) < len(outputs):
+        raise ValueError("Prefabs need every output to use a different axis combination.")
+    return PrefabStore(os.path.dirname(os.path.abspath(input_path)), output_dirs, prefab_dirs, cache_dir, dialect,
+                       texture_map)
+
+# --- File-level Flips ---
+def _partial_path(output_path):
+    return f"{output_path}.partial"
+
+def flip_map_file(input_path, output_path, flip_x, flip_y, flip_z, wad_dirs=(), use_wads=True, cache_dir=None,
+                  progress=None, cancel=None, entities=True, brushes=True, classnames=None, dialect=None,
+                  texture_map=None, pipeline=False, memo_size=0, stats=None, prefabs=False, prefab_dirs=()):
+    """Flips a .map file on disk. Raises instead of showing dialogs.
+
+    WADs are looked up next to the map first, then in wad_dirs. Output is written to a
+    side file and moved into place at the end, so errors and cancellation leave no partial map.
+    entities=False, brushes=False or a classnames collection restrict what gets transformed;
+    everything else is copied untouched (see flip_map_text_selective).
+    texture_map: a remap table dict or the path of one (see load_texture_map).
+    pipeline: read and write on background threads (run_io_pipeline); helps on slow storage.
+    memo_size / stats: see flip_map_lines. Selective flips read the whole map at once and
+    raise ValueError if pipeline, memo_size, stats or prefabs is given.
+    prefabs: write flipped copies of the prefabs that instances reference (searched next to
+    the map, then in prefab_dirs) beside the output and point the instances at them; see PrefabStore.
+    """
+    if not (flip_x or flip_y or flip_z):
+        raise ValueError("Please select at least one axis to flip.")
+    if not (entities or brushes):
+        raise ValueError("Nothing to transform: both entities and brushes are excluded.")
+    if isinstance(texture_map, str):
+        texture_map = load_texture_map(texture_map)
+    search_dirs = [os.path.dirname(os.path.abspath(input_path)), *wad_dirs] if use_wads else None
+    selective = not (entities and brushes) or classnames is not None
+    if prefabs and selective:
+        raise ValueError("Prefabs can only be flipped with the whole map (no entity, brush or classname filter).")
+    if selective and (pipeline or memo_size or stats is not None):
+        raise ValueError("Pipelined I/O, the line memo and statistics only work on whole-map flips "
+                         "(no entity, brush or classname filter).")
+    store = _prefab_store(input_path, [(output_path, flip_x, flip_y, flip_z)], prefab_dirs, cache_dir, dialect,
+                          texture_map) if prefabs else None
+    partial_path = _partial_path(output_path)
+    try:
+        with open(input_path, 'r') as infile, open(partial_path, 'w') as outfile:
+            if selective:
+                outfile.writelines(flip_map_text_selective(infile.read(), flip_x, flip_y, flip_z, entities, brushes,
+                                                           classnames, search_dirs, cache_dir, progress, cancel,
+                                                           dialect=dialect, texture_map=texture_map))
+            else:
+                transform = lambda lines: flip_map_lines(lines, flip_x, flip_y, flip_z, search_dirs, cache_dir,
+                                                         progress, cancel, os.path.getsize(input_path),
+                                                         dialect=dialect, texture_map=texture_map,
+                                                         memo_size=memo_size, stats=stats, prefabs=store)
+                if pipeline:
+                    run_io_pipeline(infile, outfile, transform)
+                else:
+                    outfile.writelines(transform(infile))
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    if store and stats is not None:
+        stats.update(store.stats)
+    return True
+
+def flip_map_file_multi(input_path, outputs, wad_dirs=(), use_wads=True, cache_dir=None, progress=None, cancel=None,
+                        dialect=None, texture_map=None, memo_size=0, stats=None, prefabs=False, prefab_dirs=()):
+    """Writes several flips of one map in a single read.
+
+    outputs: list of (output_path, flip_x, flip_y, flip_z). All outputs appear together
+    at the end; on error or cancellation none of them are left behind (flipped prefabs may be).
+    """
+    if not outputs:
+        raise ValueError("Please give at least one output.")
+    if not all(fx or fy or fz for _, fx, fy, fz in outputs):
+        raise ValueError("Please select at least one axis to flip for every output.")
+    if isinstance(texture_map, str):
+        texture_map = load_texture_map(texture_map)
+    search_dirs = [os.path.dirname(os.path.abspath(input_path)), *wad_dirs] if use_wads else None
+    configs = [(fx, fy, fz) for _, fx, fy, fz in outputs]
+    store = _prefab_store(input_path, outputs, prefab_dirs, cache_dir, dialect, texture_map) if prefabs else None
+    partial_paths = [_partial_path(path) for path, _, _, _ in outputs]
+    outfiles = []
+    try:
+        with open(input_path, 'r') as infile:
+            outfiles = [open(path, 'w') for path in partial_paths]
+            writes = [f.write for f in outfiles]
+            for out in flip_map_lines_multi(infile, configs, search_dirs, cache_dir,
+                                            progress, cancel, os.path.getsize(input_path), dialect=dialect,
+                                            texture_map=texture_map, memo_size=memo_size, stats=stats,
+                                            prefabs=store):
+                if out.__class__ is str:
+                    for write in writes: write(out)
+                else:
+                    for write, line in zip(writes, out): write(line)
+            for f in outfiles: f.close()
+        for partial_path, (output_path, _, _, _) in zip(partial_paths, outputs):
+            os.replace(partial_path, output_path)
+    except BaseException:
+        for f in outfiles: f.close()
+        for partial_path in partial_paths:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        raise
+    if store and stats is not None:
+        stats.update(store.stats)
+    return True
+
+def flip_map_bytes(data, flip_x, flip_y, flip_z, wad_dirs=None, cache_dir=None, dialect=None, texture_map=None,
+                   memo_size=0, prefabs=None):
+    """Flips .map file contents held in memory (bytes in, bytes out)."""
+    if not (flip_x or flip_y or flip_z):
+        raise ValueError("Please select at least one axis to flip.")
+    if isinstance(texture_map, str):
+        texture_map = load_texture_map(texture_map)
+    # latin-1 round-trips any byte, so odd characters in messages survive untouched
+    infile = io.StringIO(data.decode('latin-1'), newline=None)
+    return "".join(flip_map_lines(infile, flip_x, flip_y, flip_z, wad_dirs, cache_dir, dialect=dialect,
+                                  texture_map=texture_map, memo_size=memo_size, prefabs=prefabs)).encode('latin-1')
+
+# --- Compiler Debug Files (.pts / .lin / .prt) ---
+# Leak traces and portal files from compiling the unflipped map, moved to match the
+# flipped one. They can hold millions of points, so coordinates are handled a whole
+# column at a time on the raw tokens: a flip only negates, which needs no float
+# round-trip and keeps the compiler's precision.
+DEBUG_FILE_EXTENSIONS = (".pts", ".lin", ".prt")
+
+def _negate_token(token):
+    if token[0] == '-':
+        return token[1:]
+    if token[0] == '+':
+        return '-' + token[1:]
+    return token if not token.strip('0.') else '-' + token
+
+def _flip_token_columns(tokens, flip_x, flip_y, flip_z):
+    """Negates the x/y/z columns of a flat [x, y, z, x, y, z, ...] token list in place."""
+    for axis, flip in enumerate((flip_x, flip_y, flip_z)):
+        if flip:
+            tokens[axis::3] = [_negate_token(t) for t in tokens[axis::3]]
+    return tokens
+
+def flip_point_text(text, flip_x, flip_y, flip_z):
+    """Flips a pointfile (.pts) or line file (.lin): one "x y z" point per line."""
+    tokens = text.split()
+    if len(tokens) % 3:
+        raise ValueError("Point file is not a list of x y z points.")
+    tokens = _flip_token_columns(tokens, flip_x, flip_y, flip_z)
+    points = zip(tokens[0::3], tokens[1::3], tokens[2::3])
+    return "".join(f"{x} {y} {z}\n" for x, y, z in points)
+
+def flip_portal_text(text, flip_x, flip_y, flip_z):
+    """Flips a portal file (PRT1, PRT1-AM, PRT2 and the Quake 3 PRT1 face section).
+
+    Header, leaf and cluster lines are copied; every line holding "( x y z )" windings
+    has its points flipped, and reversed when an odd number of axes is flipped so the
+    portal keeps facing the same leaf.
+    """
+    lines = text.splitlines()
+    if not lines or not lines[0].strip().startswith(("PRT1", "PRT2")):
+        raise ValueError("Not a portal file (expected a PRT1 or PRT2 header).")
+    reverse_winding = sum([flip_x, flip_y, flip_z]) % 2 != 0
+    winding_rows = [i for i, line in enumerate(lines) if '(' in line]
+    heads, counts, tokens = [], [], []
+    for i in winding_rows:
+        head, _, tail = lines[i].partition('(')
+        row = tail.replace('(', ' ').replace(')', ' ').split()
+        if len(row) % 3:
+            raise ValueError(f"Malformed portal winding on line {i + 1}.")
+        heads.append(head)
+        counts.append(len(row) // 3)
+        tokens += row
+    tokens = _flip_token_columns(tokens, flip_x, flip_y, flip_z)
+    points = [f"({x} {y} {z} ) " for x, y, z in zip(tokens[0::3], tokens[1::3], tokens[2::3])]
+    start = 0
+    for i, head, count in zip(winding_rows, heads, counts):
+        winding = points[start:start + count]
+        start += count
+        if reverse_winding:
+            winding.reverse()
+        lines[i] = head + "".join(winding).rstrip()
+    return "\n".join(lines) + "\n"
+
+def flip_debug_file(input_path, output_path, flip_x, flip_y, flip_z):
+    """Flips one .pts, .lin or .prt file, picked by extension."""
+    if not (flip_x or flip_y or flip_z):
+        raise ValueError("Please select at least one axis to flip.")
+    ext = os.path.splitext(input_path)[1].lower()
+    if ext not in DEBUG_FILE_EXTENSIONS:
+        raise ValueError(f"Unsupported debug file type: {input_path}")
+    with open(input_path, 'r', encoding='latin-1') as infile:
+        text = infile.read()
+    flip = flip_portal_text if ext == ".prt" else flip_point_text
+    text = flip(text, flip_x, flip_y, flip_z)
+    partial_path = _partial_path(output_path)
+    try:
+        with open(partial_path, 'w', encoding='latin-1') as outfile:
+            outfile.write(text)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return True
+
+def find_debug_files(map_path):
+    """Returns the .pts/.lin/.prt files that sit next to map_path with the same base name."""
+    base = os.path.splitext(map_path)[0]
+    return [base + ext for ext in DEBUG_FILE_EXTENSIONS if os.path.isfile(base + ext)]
+
+def flip_debug_files(input_map, output_map, flip_x, flip_y, flip_z):
+    """Flips the debug files found next to input_map into files named after output_map.
+    Returns the list of written paths (empty when the map was never compiled)."""
+    out_base = os.path.splitext(output_map)[0]
+    written = []
+    for path in find_debug_files(input_map):
+        output_path = out_base + os.path.splitext(path)[1]
+        flip_debug_file(path, output_path, flip_x, flip_y, flip_z)
+        written.append(output_path)
+    return written
+
+def process_map_file(input_path, output_path, flip_x, flip_y, flip_z, progress=None, cancel=None, debug_files=False):
+    if not (flip_x or flip_y or flip_z):
+        messagebox.showerror("Error", "Please select at least one axis to flip.")
+        return False
+
+    try:
+        flip_map_file(input_path, output_path, flip_x, flip_y, flip_z, progress=progress, cancel=cancel)
+    except FlipCancelled:
+        return False
 
     except FileNotFoundError:
         messagebox.showerror("Error", f"Input file not found:\n{input_path}")
@@ -195,19 +1459,1251 @@ def process_map_file(input_path, output_path, flip_x, flip_y, flip_z):
         traceback.print_exc()
         return False
 
+    # The map is written by now; a bad debug file shouldn't make it look like a failure
+    if debug_files:
+        try:
+            flip_debug_files(input_path, output_path, flip_x, flip_y, flip_z)
+        except Exception as e:
+            messagebox.showwarning("Debug Files", f"The map was flipped, but its debug files were not:\n{e}")
+    return True
+
+
+# --- Entity Files (.ent / BSP entity lump) ---
+# Entity-only flips for compiled maps: .ent override files, and the entity lump of a .bsp
+# found through its header. Only the entity text is read and rewritten, with the same key
+# rules as a .map flip; geometry is never touched.
+BSP_ENTITY_LUMP_ALIGN = 4
+
+def _bsp_entity_lump_entry(f):
+    """(header offset of the entity lump entry, lump offset, lump length). Entities are
+    lump 0 in every supported format: Quake (29, BSP2, 2PSB), Half-Life (30),
+    Quake 2 / Quake 3 (IBSP) and Source (VBSP)."""
+    f.seek(0)
+    head = f.read(8)
+    if len(head) < 8:
+        raise ValueError("Not a BSP file: too short.")
+    if head[:4] in (b"BSP2", b"2PSB"):
+        entry = 4
+    elif head[:4] in (b"IBSP", b"VBSP"):
+        entry = 8 # Magic and version come first
+    elif struct.unpack("<i", head[:4])[0] in (29, 30):
+        entry = 4
+    else:
+        raise ValueError(f"Not a supported BSP file (header {head[:4]!r}).")
+    f.seek(entry)
+    offset, length = struct.unpack("<ii", f.read(8))
+    f.seek(0, os.SEEK_END)
+    if offset < 0 or length < 0 or offset + length > f.tell():
+        raise ValueError("BSP entity lump points outside the file.")
+    return entry, offset, length
+
+def read_bsp_entities(bsp_path):
+    """The entity lump of a .bsp as bytes, without its terminating NUL."""
+    with open(bsp_path, 'rb') as f:
+        _, offset, length = _bsp_entity_lump_entry(f)
+        f.seek(offset)
+        return f.read(length).split(b"\0", 1)[0]
+
+def write_bsp_entities(bsp_path, data):
+    """Replaces the entity lump of a .bsp in place. Text that fits is written over the old
+    lump (zero padded); longer text is appended at the end of the file and the header
+    entry is pointed at it. Nothing else in the file moves."""
+    data += b"\0"
+    with open(bsp_path, 'r+b') as f:
+        entry, offset, length = _bsp_entity_lump_entry(f)
+        if len(data) <= length:
+            f.seek(offset)
+            f.write(data + b"\0" * (length - len(data)))
+            return
+        end = f.seek(0, os.SEEK_END)
+        padding = -end % BSP_ENTITY_LUMP_ALIGN
+        f.write(b"\0" * padding + data)
+        f.seek(entry)
+        f.write(struct.pack("<ii", end + padding, len(data)))
+
+def flip_entity_file(input_path, output_path, flip_x, flip_y, flip_z, in_place=False):
+    """Flips the entities of a .ent file or a .bsp entity lump.
+
+    output_path ending in .ent gets the entity text; a .bsp output is a copy of the input
+    with its lump replaced. in_place=True rewrites the input itself (output_path unused).
+    Returns the path written.
+    """
+    is_bsp = input_path.lower().endswith(".bsp")
+    if in_place:
+        output_path = input_path
+    elif not output_path:
+        raise ValueError("Please give an output file, or rewrite the input in place.")
+    if output_path.lower().endswith(".bsp") and not is_bsp:
+        raise ValueError("A .bsp output needs a .bsp input to take the geometry from.")
+    if is_bsp:
+        data = read_bsp_entities(input_path)
+    else:
+        with open(input_path, 'rb') as f:
+            data = f.read()
+    flipped = flip_map_bytes(data, flip_x, flip_y, flip_z)
+    if is_bsp and output_path.lower().endswith(".bsp"):
+        if output_path == input_path:
+            write_bsp_entities(output_path, flipped)
+            return output_path
+        partial_path = _partial_path(output_path)
+        try:
+            shutil.copyfile(input_path, partial_path)
+            write_bsp_entities(partial_path, flipped)
+            os.replace(partial_path, output_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        return output_path
+    partial_path = _partial_path(output_path)
+    try:
+        with open(partial_path, 'wb') as f:
+            f.write(flipped)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return output_path
+
+
+# --- Mirror and Merge (symmetric maps) ---
+# Writes the original map plus its mirror as one map. Brushes and entities that are
+# symmetric about the mirror plane would come out twice; they are found by hashing a
+# canonical form (sorted plane set / normalized keys), so the pass stays linear.
+def iter_map_entities(lines):
+    """Yields top-level lines (comments, blanks) as strings and each entity as
+    (key_lines, brushes), where brushes holds the inner lines of each brush block."""
+    key_lines = brushes = brush = None
+    depth = 0
+    for line in lines:
+        stripped = line.strip()
+        if stripped == "{":
+            depth += 1
+            if depth == 1:
+                key_lines, brushes = [], []
+                continue
+            if depth == 2:
+                brush = []
+                continue
+        elif stripped == "}":
+            depth = max(0, depth - 1)
+            if depth == 0 and key_lines is not None:
+                yield key_lines, brushes
+                key_lines = None
+                continue
+            if depth == 1:
+                brushes.append(brush)
+                continue
+        if depth == 0:
+            yield line
+        elif depth == 1:
+            key_lines.append(line)
+        else:
+            brush.append(line) # Nested blocks (patches) stay as raw lines
+
+def _entity_classname(key_lines):
+    for line in key_lines:
+        classname_match = entity_classname_re.match(line)
+        if classname_match:
+            return classname_match.group(3)
+    return None
+
+def _plane_normal_distance(verts):
+    """Unit normal and distance of the plane through a face's three points."""
+    x1, y1, z1, x2, y2, z2, x3, y3, z3 = verts
+    ax, ay, az = x2 - x1, y2 - y1, z2 - z1
+    bx, by, bz = x3 - x1, y3 - y1, z3 - z1
+    nx, ny, nz = ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx
+    length = math.sqrt(nx * nx + ny * ny + nz * nz) or 1.0
+    nx, ny, nz = nx / length, ny / length, nz / length
+    return nx, ny, nz, nx * x1 + ny * y1 + nz * z1
+
+def _canonical_plane(plane):
+    """Plane as (normal, distance) rounded, independent of which three points define it."""
+    nx, ny, nz, dist = _plane_normal_distance(plane[0])
+    # + 0.0 folds -0.0 into 0.0 so mirrored zeros hash the same
+    return (round(nx, 4) + 0.0, round(ny, 4) + 0.0, round(nz, 4) + 0.0, round(dist, 2) + 0.0)
+
+def _brush_key(planes, brush_lines):
+    """Hashable canonical form of a brush: its sorted set of planes."""
+    if planes is None:
+        return tuple(line.strip() for line in brush_lines) # Not plain faces; compare text
+    return tuple(sorted(set(map(_canonical_plane, planes))))
+
+def _parse_brush(brush_lines, dialect):
+    """Parsed planes of a brush, or None if any line isn't a plain face."""
+    planes = []
+    for line in brush_lines:
+        face_dialect, plane_match = match_face(dialect, line)
+        if not plane_match or face_dialect.flip is not dialect.flip:
+            return None # Faces of another family are compared and flipped line by line
+        planes.append(face_dialect.parse(plane_match))
+    return planes
+
+def _mirror_verts(verts, flip_x, flip_y, flip_z, reverse_winding):
+    """A face's nine point coordinates flipped, in the flipped winding order."""
+    sx, sy, sz = (-1.0 if flip_x else 1.0), (-1.0 if flip_y else 1.0), (-1.0 if flip_z else 1.0)
+    x1, y1, z1, x2, y2, z2, x3, y3, z3 = verts
+    if reverse_winding: x2, y2, z2, x3, y3, z3 = x3, y3, z3, x2, y2, z2
+    return sx * x1, sy * y1, sz * z1, sx * x2, sy * y2, sz * z2, sx * x3, sy * y3, sz * z3
+
+def _mirror_brush(brush_lines, planes, dialect, flip_x, flip_y, flip_z, reverse_winding, texture_sizes,
+                  texture_map=None):
+    """Mirrored brush lines and their brush key, computed from the already parsed planes."""
+    if planes is None: # Quake 3 block or unknown lines: flip what we can, compare as text
+        lines = _flip_brush_lines(brush_lines, dialect, flip_x, flip_y, flip_z, reverse_winding, texture_sizes,
+                                  texture_map)
+        return lines, _brush_key(None, lines)
+    mirrored_planes = [(_mirror_verts(verts, flip_x, flip_y, flip_z, reverse_winding), *tex) for verts, *tex in planes]
+    if texture_map:
+        planes = [_remap_texture(dialect, plane, texture_map, flip_x, flip_y) for plane in planes]
+    lines = [dialect.flip(plane, flip_x, flip_y, flip_z, reverse_winding, texture_sizes) for plane in planes]
+    return lines, _brush_key(mirrored_planes, None)
+
+def _mirror_key_lines(key_lines, classname, flip_x, flip_y, flip_z):
+    """Entity keys with the V4 rules applied, minus the message/map renames (the merged
+    map is still the same level)."""
+    mirrored = []
+    for line in key_lines:
+        kind, match = _match_entity_line(line, classname)
+        if kind and kind not in ("message", "map"):
+            line = _flip_entity_line(kind, match, flip_x, flip_y, flip_z)
+        mirrored.append(line)
+    return mirrored
+
+def _entity_key(key_lines, classname, brush_keys):
+    """Hashable canonical form of an entity: normalized key lines plus its brush keys."""
+    keys = []
+    for line in key_lines:
+        if not line.strip() or line.strip().startswith("//"):
+            continue
+        kind, match = _match_entity_line(line, classname)
+        if kind in ("origin", "angle", "angles"):
+            line = _flip_entity_line(kind, match, False, False, False) # Same number formatting both sides
+        keys.append(line.strip())
+    return tuple(sorted(keys)), tuple(sorted(brush_keys))
+
+def _write_entity(outfile, key_lines, brushes):
+    outfile.write("{\n")
+    outfile.writelines(line for line in key_lines if not line.strip().startswith("//"))
+    for brush in brushes:
+        outfile.write("{\n")
+        outfile.writelines(brush)
+        outfile.write("}\n")
+    outfile.write("}\n")
+
+def mirror_merge_map_file(input_path, output_path, flip_x, flip_y, flip_z, wad_dirs=(), use_wads=True, cache_dir=None,
+                          dialect=None, texture_map=None):
+    """Writes the map plus its mirror across the chosen axes as one map, dropping mirrored
+    brushes/entities that duplicate an original. Returns counts of what was kept and dropped."""
+    if not (flip_x or flip_y or flip_z):
+        raise ValueError("Please select at least one axis to flip.")
+    if isinstance(texture_map, str):
+        texture_map = load_texture_map(texture_map)
+    reverse_winding = sum([flip_x, flip_y, flip_z]) % 2 != 0
+    search_dirs = [os.path.dirname(os.path.abspath(input_path)), *wad_dirs] if use_wads else None
+    dialect = get_dialect(dialect)
+    stats = collections.Counter()
+    texture_sizes = {}
+    original_entity_keys = set()
+    mirrored_entities = [] # (key, key_lines, brushes), written after all originals
+    partial_path = _partial_path(output_path)
+    try:
+        with open(input_path, 'r') as infile, open(partial_path, 'w') as outfile:
+            if dialect is None:
+                dialect = detect_map_dialect(infile) # Stops at the first face
+                infile.seek(0)
+            for item in iter_map_entities(infile):
+                if isinstance(item, str):
+                    if item.strip(): outfile.write(item) # Header comments
+                    continue
+                key_lines, brushes = item
+                classname = _entity_classname(key_lines)
+                if classname == "worldspawn":
+                    if search_dirs is not None:
+                        for line in key_lines:
+                            wad_match = entity_wad_re.match(line)
+                            if wad_match:
+                                texture_sizes = texture_sizes_for_wad_key(wad_match.group(3), search_dirs, cache_dir)
+                    # World brushes merge into the one worldspawn
+                    parsed = [_parse_brush(brush, dialect) for brush in brushes]
+                    seen = {_brush_key(planes, brush) for planes, brush in zip(parsed, brushes)}
+                    merged = list(brushes)
+                    for planes, brush in zip(parsed, brushes):
+                        mirrored, key = _mirror_brush(brush, planes, dialect, flip_x, flip_y, flip_z,
+                                                      reverse_winding, texture_sizes, texture_map)
+                        if key in seen:
+                            stats["duplicate_brushes_removed"] += 1
+                            continue
+                        seen.add(key)
+                        merged.append(mirrored)
+                        stats["mirrored_brushes_added"] += 1
+                    stats["brushes"] += len(merged)
+                    _write_entity(outfile, key_lines, merged)
+                    continue
+                _write_entity(outfile, key_lines, brushes)
+                parsed = [_parse_brush(brush, dialect) for brush in brushes]
+                original_entity_keys.add(_entity_key(key_lines, classname, map(_brush_key, parsed, brushes)))
+                mirrored_keys = _mirror_key_lines(key_lines, classname, flip_x, flip_y, flip_z)
+                mirrored = [_mirror_brush(brush, planes, dialect, flip_x, flip_y, flip_z, reverse_winding, texture_sizes,
+                                          texture_map) for planes, brush in zip(parsed, brushes)]
+                mirrored_brushes = [lines for lines, _ in mirrored]
+                key = _entity_key(mirrored_keys, classname, [brush_key for _, brush_key in mirrored])
+                mirrored_entities.append((key, mirrored_keys, mirrored_brushes))
+                stats["brushes"] += len(brushes)
+                stats["entities"] += 1
+            seen = original_entity_keys
+            for key, key_lines, brushes in mirrored_entities:
+                if key in seen:
+                    stats["duplicate_entities_removed"] += 1
+                    continue
+                seen.add(key)
+                _write_entity(outfile, key_lines, brushes)
+                stats["mirrored_entities_added"] += 1
+                stats["brushes"] += len(brushes)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    stats["entities"] += stats["mirrored_entities_added"] + 1 # + worldspawn
+    return dict(stats)
+
+
+# --- Inspect (read-only scanner) ---
+# Quick facts about a map without flipping it. Whole-file regexes do the line work in C,
+# and only the distinct coordinate strings per axis are ever converted to numbers.
+# Anchored on "\n" rather than ^ with re.M, which is several times faster on big files.
+inspect_face_re = re.compile(
+    rb'\n[ \t]*\(([^()\n]*)\)[ \t]*\(([^()\n]*)\)[ \t]*\(([^()\n]*)\)[ \t]*([^\s()\[\]]+)[ \t]*(\[?)')
+# Quake 3 brushDef face: the texture matrix "( ( a b c ) ( d e f ) )" comes before the texture name
+inspect_brushdef_face_re = re.compile(
+    rb'\n[ \t]*\(([^()\n]*)\)[ \t]*\(([^()\n]*)\)[ \t]*\(([^()\n]*)\)[ \t]*'
+    rb'\([ \t]*\([^()\n]*\)[ \t]*\([^()\n]*\)[ \t]*\)[ \t]*([^\s()]+)')
+inspect_struct_re = re.compile(rb'\n[ \t]*(\{|\}|patchDef\w*|"([^"\n]*)"[ \t]*"([^"\n]*)")[ \t]*\r?(?=\n|\Z)')
+
+def _axis_bounds(tokens):
+    """(min, max) of a list of number strings, converting each distinct string once."""
+    values = list(map(float, set(tokens)))
+    return min(values), max(values)
+
+def inspect_map(input_path):
+    """Scans a .map file and returns a dict of counts, textures, bounds and format facts."""
+    with open(input_path, 'rb') as f:
+        data = b"\n" + f.read()
+
+    classnames = collections.Counter()
+    keys_seen = set()
+    origins = []
+    entities = brushes = world_brushes = patches = 0
+    brace_level = 0
+    classname = None
+    wad = None
+    for token, key, value in inspect_struct_re.findall(data):
+        if token == b"{":
+            brace_level += 1
+            if brace_level == 1:
+                entities += 1
+                classname = None
+            elif brace_level == 2:
+                brushes += 1
+                world_brushes += classname == b"worldspawn"
+        elif token == b"}":
+            brace_level = max(0, brace_level - 1)
+        elif token.startswith(b"patchDef"):
+            if brace_level == 2: # The block opened as a brush is a patch
+                patches += 1
+                brushes -= 1
+                world_brushes -= classname == b"worldspawn"
+        elif brace_level == 1:
+            keys_seen.add(key)
+            if key == b"classname":
+                classname = value
+                classnames[value] += 1
+            elif key == b"origin":
+                origins.append(value)
+            elif key == b"wad":
+                wad = value
+
+    faces = inspect_face_re.findall(data)
+    brushdef_faces = inspect_brushdef_face_re.findall(data) if b"brushDef" in data else []
+    textures = collections.Counter()
+    bounds = None
+    tokens = []
+    valve_faces = 0
+    if faces:
+        p1, p2, p3, tex_names, brackets = zip(*faces)
+        textures.update(tex_names)
+        valve_faces = brackets.count(b"[")
+        tokens = b" ".join(p1 + p2 + p3).split()
+    if brushdef_faces:
+        p1, p2, p3, tex_names = zip(*brushdef_faces)
+        textures.update(tex_names)
+        tokens += b" ".join(p1 + p2 + p3).split()
+    formats = [name for name, count in (("Valve 220", valve_faces), ("Standard", len(faces) - valve_faces),
+                                        ("brushDef", len(brushdef_faces))) if count]
+    face_format = formats[0] if len(formats) == 1 else "Mixed" if formats else None
+    tokens += b" ".join(o for o in origins if o.count(b" ") == 2).split()
+    if tokens and len(tokens) % 3 == 0:
+        axes = [_axis_bounds(tokens[i::3]) for i in range(3)]
+        bounds = {"min": [a[0] for a in axes], "max": [a[1] for a in axes]}
+
+    decode = lambda b: b.decode('latin-1')
+    return {
+        "path": input_path,
+        "bytes": len(data) - 1,
+        "entities": entities,
+        "classnames": {decode(k): v for k, v in classnames.most_common()},
+        "brushes": brushes,
+        "world_brushes": world_brushes,
+        "entity_brushes": brushes - world_brushes,
+        "patches": patches,
+        "faces": len(faces) + len(brushdef_faces),
+        "textures": {decode(k): v for k, v in textures.most_common()},
+        "bounds": bounds,
+        "face_format": face_format,
+        "has_angles": b"angles" in keys_seen,
+        "has_mangle": b"mangle" in keys_seen,
+        "wad": decode(wad) if wad is not None else None,
+    }
+
+def find_map_files(paths, extensions=(".map",)):
+    """Expands directories (recursively) into the map files they contain."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(extensions))
+        else:
+            found.append(path)
+    return found
+
+def inspect_maps(paths, jobs=None):
+    """Inspects many maps, in parallel processes when there is more than one."""
+    files = find_map_files(paths)
+    if len(files) <= 1 or jobs == 1:
+        return [inspect_map(path) for path in files]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(inspect_map, files))
+
+
+# --- Preview (top-down / side PNG) ---
+# A quick look at a map without compiling it: brush footprints and point entities are
+# drawn from the plane data into a palette PNG. Box brushes (every face on an axis plane,
+# most of any Quake map) become rectangles straight from their face coordinates; other
+# brushes get their vertices from plane intersections. Fills work a whole pixel span at a
+# time with bytes.translate, and overlapping brushes build up brightness, so walls and
+# stacked detail stand out from floors.
+preview_re = re.compile(
+    rb'\n[ \t]*(?:(\{)|(\})|\(([^()\n]*)\)[ \t]*\(([^()\n]*)\)[ \t]*\(([^()\n]*)\)|"(classname|origin)"[ \t]*"([^"\n]*)")')
+PREVIEW_DEFAULT_SIZE = 1024
+PREVIEW_MARGIN = 4
+PREVIEW_MAX_DENSITY = 200
+PREVIEW_ENTITY = 255 # Palette index of point entity markers
+PREVIEW_PLAYER = 254 # ... and of player starts
+# Adds one brush to a span: density + 1, capped, markers left alone
+_PREVIEW_ADD = bytes(min(v + 1, PREVIEW_MAX_DENSITY) if v < PREVIEW_MAX_DENSITY else v for v in range(256))
+
+def _preview_palette():
+    palette = bytearray(b"\x10\x10\x18" * 256)
+    for level in range(1, PREVIEW_MAX_DENSITY + 1):
+        t = 1.0 - 0.75 ** level
+        palette[level * 3:level * 3 + 3] = bytes((int(50 + 190 * t), int(60 + 180 * t), int(90 + 160 * t)))
+    palette[PREVIEW_PLAYER * 3:PREVIEW_PLAYER * 3 + 3] = b"\x30\xe0\x40"
+    palette[PREVIEW_ENTITY * 3:PREVIEW_ENTITY * 3 + 3] = b"\xf0\x50\x30"
+    return bytes(palette)
+
+def write_png(path, width, height, rows, palette):
+    """Writes an 8-bit palette PNG. rows: height byte strings of width palette indices."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    raw = b"".join(b"\x00" + bytes(row) for row in rows) # Filter type 0 on every row
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)))
+        f.write(chunk(b"PLTE", palette))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        f.write(chunk(b"IEND", b""))
+
+def _brush_box(faces):
+    """(min, max) per axis if every face lies on an axis plane, else None."""
+    xs, ys, zs = [], [], []
+    for p1, p2, p3 in faces:
+        if p1[0] == p2[0] == p3[0]: xs.append(p1[0])
+        elif p1[1] == p2[1] == p3[1]: ys.append(p1[1])
+        elif p1[2] == p2[2] == p3[2]: zs.append(p1[2])
+        else: return None
+    if len(xs) < 2 or len(ys) < 2 or len(zs) < 2:
+        return None
+    return (min(xs), max(xs)), (min(ys), max(ys)), (min(zs), max(zs))
+
+def _brush_vertices(faces):
+    """Corners of a convex brush: plane triple intersections inside every plane."""
+    planes = [_plane_normal_distance((*p1, *p2, *p3)) for p1, p2, p3 in faces]
+    inside = ([], []) # Either side may be "inside" depending on the editor's winding
+    count = len(planes)
+    for i in range(count - 2):
+        ax, ay, az, ad = planes[i]
+        for j in range(i + 1, count - 1):
+            bx, by, bz, bd = planes[j]
+            cx1, cy1, cz1 = ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx # a x b
+            for k in range(j + 1, count):
+                cx, cy, cz, cd = planes[k]
+                det = ax * (by * cz - bz * cy) + ay * (bz * cx - bx * cz) + az * (bx * cy - by * cx)
+                if abs(det) < 1e-9:
+                    continue
+                # Cramer's rule: p = (ad (b x c) + bd (c x a) + cd (a x b)) / det
+                x = (ad * (by * cz - bz * cy) + bd * (cy * az - cz * ay) + cd * cx1) / det
+                y = (ad * (bz * cx - bx * cz) + bd * (cz * ax - cx * az) + cd * cy1) / det
+                z = (ad * (bx * cy - by * cx) + bd * (cx * ay - cy * ax) + cd * cz1) / det
+                sides = [nx * x + ny * y + nz * z - d for nx, ny, nz, d in planes]
+                if max(sides) <= 0.01: inside[0].append((x, y, z))
+                elif min(sides) >= -0.01: inside[1].append((x, y, z))
+    return max(inside, key=len)
+
+def _convex_hull(points):
+    """Convex hull of 2D points in counter-clockwise order (monotone chain)."""
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+    def half(pts):
+        hull = []
+        for p in pts:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (p[1] - hull[-2][1])
+                                      - (hull[-1][1] - hull[-2][1]) * (p[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(p)
+        return hull[:-1]
+    return half(points) + half(points[::-1])
+
+def read_map_geometry(input_path):
+    """Brush boxes ((xmin, xmax), (ymin, ymax), (zmin, zmax)), other brushes as vertex
+    lists, and point entities as (x, y, z, classname), from one whole-file scan."""
+    with open(input_path, 'rb') as f:
+        data = b"\n" + f.read()
+    boxes, shapes, points = [], [], []
+    parsed = {} # "x y z" text -> floats; vertices repeat a lot between faces
+
+    def point(text):
+        try:
+            value = tuple(map(float, text.split()))
+        except ValueError:
+            value = None
+        parsed[text] = value = value if value and len(value) == 3 else None
+        return value
+    depth = 0
+    faces = []
+    has_brushes = False
+    classname = origin = None
+    for open_brace, close_brace, t1, t2, t3, key, value in preview_re.findall(data):
+        if t1:
+            if depth >= 2:
+                face = (parsed.get(t1) or point(t1), parsed.get(t2) or point(t2), parsed.get(t3) or point(t3))
+                if None not in face:
+                    faces.append(face)
+        elif open_brace:
+            depth += 1
+            if depth == 1:
+                classname = origin = None
+                has_brushes = False
+        elif close_brace:
+            depth = max(0, depth - 1)
+            if depth == 1:
+                has_brushes = True
+                if len(faces) >= 4:
+                    box = _brush_box(faces)
+                    if box: boxes.append(box)
+                    else:
+                        vertices = _brush_vertices(faces)
+                        if vertices: shapes.append(vertices)
+                faces = []
+            elif depth == 0 and origin is not None and not has_brushes:
+                try:
+                    x, y, z = map(float, origin.split())
+                    points.append((x, y, z, classname.decode('latin-1') if classname else None))
+                except ValueError:
+                    pass
+        elif depth == 1:
+            if key == b"classname": classname = value
+            else: origin = value
+    return boxes, shapes, points
+
+class _PreviewRaster:
+    """Palette-index image of one projection; u/v are the map axes drawn across/up."""
+
+    def __init__(self, u_range, v_range, size):
+        extent = max(u_range[1] - u_range[0], v_range[1] - v_range[0], 1.0)
+        self.scale = (size - 2 * PREVIEW_MARGIN) / extent
+        self.u0, self.v1 = u_range[0], v_range[1]
+        self.width = int((u_range[1] - u_range[0]) * self.scale) + 2 * PREVIEW_MARGIN + 1
+        self.height = int((v_range[1] - v_range[0]) * self.scale) + 2 * PREVIEW_MARGIN + 1
+        self.rows = [bytearray(self.width) for _ in range(self.height)]
+
+    def col(self, u):
+        return PREVIEW_MARGIN + (u - self.u0) * self.scale
+
+    def row(self, v):
+        return PREVIEW_MARGIN + (self.v1 - v) * self.scale # Map "up" is image row 0
+
+    def add_span(self, row, left, right):
+        right = max(right, left + 1) # Thin brushes still show
+        span = self.rows[row]
+        span[left:right] = span[left:right].translate(_PREVIEW_ADD)
+
+    def fill_rect(self, u_min, u_max, v_min, v_max):
+        left = int(self.col(u_min))
+        right = max(int(math.ceil(self.col(u_max))), left + 1)
+        top = int(self.row(v_max))
+        for span in self.rows[top:max(int(math.ceil(self.row(v_min))), top + 1)]:
+            span[left:right] = span[left:right].translate(_PREVIEW_ADD)
+
+    def fill_polygon(self, hull):
+        """Scanline fill of a convex polygon given as (u, v) map points."""
+        pts = [(self.col(u), self.row(v)) for u, v in hull]
+        top, bottom = min(p[1] for p in pts), max(p[1] for p in pts)
+        edges = list(zip(pts, pts[1:] + pts[:1]))
+        for row in range(int(top), max(int(math.ceil(bottom)), int(top) + 1)):
+            y = min(max(row + 0.5, top), bottom)
+            xs = [x1 + (y - y1) * (x2 - x1) / (y2 - y1) for (x1, y1), (x2, y2) in edges
+                  if y1 != y2 and min(y1, y2) <= y <= max(y1, y2)]
+            if xs:
+                self.add_span(row, int(min(xs)), int(math.ceil(max(xs))))
+            else: # Flat polygon (seen edge-on): one line of its extent
+                self.add_span(row, int(min(p[0] for p in pts)), int(math.ceil(max(p[0] for p in pts))))
+
+    def mark(self, u, v, color, radius=2):
+        col, row = int(self.col(u)), int(self.row(v))
+        for r in range(max(row - radius, 0), min(row + radius + 1, self.height)):
+            left = max(col - radius, 0)
+            right = min(col + radius + 1, self.width)
+            self.rows[r][left:right] = bytes((color,)) * (right - left)
+
+def render_map_preview(geometry, view="top", size=PREVIEW_DEFAULT_SIZE):
+    """Rasterizes read_map_geometry output. view: "top" (X right, Y up) or "side"
+    (X right, Z up). Returns (width, height, rows)."""
+    boxes, shapes, points = geometry
+    u_axis, v_axis = (0, 1) if view == "top" else (0, 2)
+    u_values = [b[u_axis][i] for b in boxes for i in (0, 1)] + [p[u_axis] for s in shapes for p in s] + \
+               [p[u_axis] for p in points]
+    v_values = [b[v_axis][i] for b in boxes for i in (0, 1)] + [p[v_axis] for s in shapes for p in s] + \
+               [p[v_axis] for p in points]
+    if not u_values:
+        raise ValueError("Nothing to draw: no brushes or point entities found.")
+    raster = _PreviewRaster((min(u_values), max(u_values)), (min(v_values), max(v_values)), size)
+    for box in boxes:
+        raster.fill_rect(box[u_axis][0], box[u_axis][1], box[v_axis][0], box[v_axis][1])
+    for vertices in shapes:
+        raster.fill_polygon(_convex_hull([(p[u_axis], p[v_axis]) for p in vertices]))
+    for point in points:
+        color = PREVIEW_PLAYER if point[3] and point[3].startswith("info_player") else PREVIEW_ENTITY
+        raster.mark(point[u_axis], point[v_axis], color)
+    return raster.width, raster.height, raster.rows
+
+def preview_map(input_path, out_dir=None, side=False, size=PREVIEW_DEFAULT_SIZE):
+    """Writes <map>_top.png (and <map>_side.png) next to the map or into out_dir.
+    Returns the written paths."""
+    geometry = read_map_geometry(input_path)
+    base = os.path.splitext(input_path)[0]
+    if out_dir:
+        base = os.path.join(out_dir, os.path.basename(base))
+    written = []
+    for view in ("top", "side") if side else ("top",):
+        width, height, rows = render_map_preview(geometry, view, size)
+        path = f"{base}_{view}.png"
+        write_png(path, width, height, rows, _preview_palette())
+        written.append(path)
+    return written
+
+def preview_maps(paths, out_dir=None, side=False, size=PREVIEW_DEFAULT_SIZE, jobs=None):
+    """preview_map for several maps (e.g. a map and its flip), in parallel processes."""
+    if len(paths) <= 1 or jobs == 1:
+        return [preview_map(path, out_dir, side, size) for path in paths]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(preview_map, path, out_dir, side, size) for path in paths]
+        return [future.result() for future in futures]
+
+
+# --- Structural Diff ---
+# Compares two maps as collections of entities and brushes instead of lines. Each entity
+# is keyed on its normalized key/value pairs and each brush on its sorted plane set
+# (normal, distance, texture), so face order, the choice of plane points and number
+# formatting don't show up as changes, and matching the two sides is a dict lookup per item.
+# Keys snap numbers to a tolerance grid, so values either side of a grid line miss each
+# other; a second pass compares what is left over with real distance checks.
+entity_key_value_re = re.compile(r'^\s*"([^"]*)"\s*"([^"]*)"\s*$')
+DIFF_DEFAULT_TOLERANCE = 0.01
+DIFF_MAX_SHARED_PLANE = 32 # Planes shared by more brushes than this don't help pair edits
+
+def _diff_numbers(value):
+    """The numbers of a numeric value (origin, angle, colours...), or None for other values."""
+    parts = value.split()
+    if not parts:
+        return None
+    try:
+        return tuple(map(float, parts))
+    except ValueError:
+        return None
+
+def _diff_value_key(value, step):
+    """Numeric values snapped to the tolerance grid; other values as is."""
+    numbers = _diff_numbers(value)
+    return value if numbers is None else tuple(round(number / step) for number in numbers)
+
+def _diff_close(numbers_a, numbers_b, step):
+    step *= 1 + 1e-9 # Values exactly one tolerance apart shouldn't fail on float rounding
+    return all(abs(a - b) <= step for a, b in zip(numbers_a, numbers_b))
+
+def _diff_values_close(value_a, value_b, step):
+    """Whether two key values are equal, numbers within tolerance."""
+    if value_a == value_b:
+        return True
+    if value_a is None or value_b is None:
+        return False
+    numbers_a, numbers_b = _diff_numbers(value_a), _diff_numbers(value_b)
+    return (numbers_a is not None and numbers_b is not None and len(numbers_a) == len(numbers_b)
+            and _diff_close(numbers_a, numbers_b, step))
+
+def _diff_entity_keys(key_lines, classname, flips, step):
+    """{key: value} of an entity, flipped first when flips is given, and its hashable form."""
+    values = {}
+    for line in key_lines:
+        if flips:
+            kind, match = _match_entity_line(line, classname)
+            if kind:
+                line = _flip_entity_line(kind, match, *flips)
+        key_match = entity_key_value_re.match(line)
+        if key_match:
+            values[key_match.group(1)] = key_match.group(2)
+    return values, tuple(sorted((key, _diff_value_key(value, step)) for key, value in values.items()))
+
+def _diff_brush_key(brush_lines, dialect, flips, reverse_winding, step):
+    """Sorted plane set of a brush, flipped first when flips is given, and its unsnapped
+    planes (normal x/y/z, distance, texture). Brushes that aren't plain faces (Quake 3 blocks)
+    are keyed on their stripped lines and have no planes."""
+    planes = _parse_brush(brush_lines, dialect)
+    if planes is None:
+        if flips:
+            brush_lines = _flip_brush_lines(brush_lines, dialect, *flips, reverse_winding, {})
+        return None, tuple(line.strip() for line in brush_lines)
+    normal_step = step / 100
+    keys = set()
+    raw = []
+    for verts, tex_name, *_ in planes:
+        if flips:
+            verts = _mirror_verts(verts, *flips, reverse_winding)
+        nx, ny, nz, dist = _plane_normal_distance(verts)
+        raw.append((nx, ny, nz, dist, tex_name))
+        keys.add((round(nx / normal_step), round(ny / normal_step), round(nz / normal_step),
+                  round(dist / step), tex_name))
+    return raw, tuple(sorted(keys))
+
+def _diff_read_map(input_path, flips, step, dialect):
+    """Entity records (index, classname, values, key) and brush records
+    (entity index, brush index, planes, key) of one map."""
+    reverse_winding = flips is not None and sum(flips) % 2 != 0
+    dialect = get_dialect(dialect)
+    entities, brushes = [], []
+    with open(input_path, 'r') as infile:
+        if dialect is None:
+            dialect = detect_map_dialect(infile) # Stops at the first face
+            infile.seek(0)
+        for item in iter_map_entities(infile):
+            if isinstance(item, str):
+                continue
+            key_lines, entity_brushes = item
+            classname = _entity_classname(key_lines)
+            index = len(entities)
+            entities.append((index, classname, *_diff_entity_keys(key_lines, classname, flips, step)))
+            for brush_index, brush in enumerate(entity_brushes):
+                brushes.append((index, brush_index, *_diff_brush_key(brush, dialect, flips, reverse_winding, step)))
+    return entities, brushes
+
+def _diff_match(records_a, records_b):
+    """Pairs records with equal keys (last field), as multisets.
+    Returns (matched count, unmatched from a, unmatched from b), each in file order."""
+    pending = collections.defaultdict(collections.deque)
+    for record in records_b:
+        pending[record[-1]].append(record)
+    matched = 0
+    left_a = []
+    for record in records_a:
+        bucket = pending.get(record[-1])
+        if bucket:
+            bucket.popleft()
+            matched += 1
+        else:
+            left_a.append(record)
+    left_b = sorted(record for bucket in pending.values() for record in bucket)
+    return matched, left_a, left_b
+
+def _diff_near_match(left_a, left_b, signature, close):
+    """Second pass over records the snapped keys left unmatched. signature(record) gives
+    (group, total, width, payload) or None: records can only be close within a group and
+    when their totals are at most width apart, which buckets the candidates.
+    Returns (matched count, unmatched from a, unmatched from b)."""
+    bucket_of = lambda total, width: math.floor(total / width) if width else 0
+    pending = collections.defaultdict(list)
+    for record in left_b:
+        sig = signature(record)
+        if sig:
+            group, total, width, payload = sig
+            pending[(group, bucket_of(total, width))].append((record, payload))
+    matched = 0
+    taken = set()
+    unmatched_a = []
+    for record in left_a:
+        sig = signature(record)
+        found = None
+        if sig:
+            group, total, width, payload = sig
+            bucket = bucket_of(total, width)
+            found = next((other for near in (bucket, bucket - 1, bucket + 1)
+                          for other, other_payload in pending.get((group, near), ())
+                          if id(other) not in taken and close(payload, other_payload)), None)
+        if found is None:
+            unmatched_a.append(record)
+        else:
+            taken.add(id(found))
+            matched += 1
+    return matched, unmatched_a, [record for record in left_b if id(record) not in taken]
+
+def _diff_entity_signature(record, step):
+    values = record[2]
+    shape, numbers = [], []
+    for key in sorted(values):
+        value_numbers = _diff_numbers(values[key])
+        if value_numbers is None:
+            shape.append((key, values[key]))
+        else:
+            shape.append((key, len(value_numbers)))
+            numbers.extend(value_numbers)
+    return (record[1], tuple(shape)), sum(numbers), len(numbers) * step, numbers
+
+def _diff_brush_signature(record, step):
+    planes = record[2]
+    if planes is None:
+        return None
+    textures = tuple(sorted(plane[4] for plane in planes))
+    return (len(planes), textures), sum(plane[3] for plane in planes), len(planes) * step, planes
+
+def _diff_planes_close(planes_a, planes_b, step):
+    """Whether every plane of one brush has its own plane in the other within tolerance
+    (1/100 of it for the normals)."""
+    remaining = list(planes_b)
+    for *normal_a, dist_a, tex_a in planes_a:
+        for i, (*normal_b, dist_b, tex_b) in enumerate(remaining):
+            if tex_a == tex_b and _diff_close((dist_a,), (dist_b,), step) and \
+                    _diff_close(normal_a, normal_b, step / 100):
+                del remaining[i]
+                break
+        else:
+            return False
+    return True
+
+def _diff_pair_entities(left_a, left_b):
+    """Pairs leftover entities with the same classname and targetname, in file order, as edits.
+    Returns (pairs, unpaired from a, unpaired from b)."""
+    by_identity = collections.defaultdict(collections.deque)
+    for record in left_b:
+        by_identity[(record[1], record[2].get("targetname"))].append(record)
+    pairs, removed = [], []
+    for record in left_a:
+        candidates = by_identity.get((record[1], record[2].get("targetname")))
+        if candidates:
+            pairs.append((record, candidates.popleft()))
+        else:
+            removed.append(record)
+    paired = {b[0] for _, b in pairs}
+    return pairs, removed, [record for record in left_b if record[0] not in paired]
+
+def _diff_pair_brushes(left_a, left_b):
+    """Pairs leftover brushes that still share at least half their planes as edits.
+    Returns (pairs, unpaired from a, unpaired from b)."""
+    by_plane = collections.defaultdict(list)
+    for i, record in enumerate(left_b):
+        for plane in record[3]:
+            by_plane[plane].append(i)
+    taken = set()
+    pairs, removed = [], []
+    for record in left_a:
+        shared = collections.Counter()
+        for plane in record[3]:
+            candidates = by_plane.get(plane, ())
+            if len(candidates) <= DIFF_MAX_SHARED_PLANE:
+                shared.update(i for i in candidates if i not in taken)
+        best = shared.most_common(1)
+        if best and 2 * best[0][1] >= max(len(record[3]), len(left_b[best[0][0]][3])):
+            taken.add(best[0][0])
+            pairs.append((record, left_b[best[0][0]]))
+        else:
+            removed.append(record)
+    return pairs, removed, [record for i, record in enumerate(left_b) if i not in taken]
+
+def _diff_entity_info(record):
+    return {"entity": record[0], "classname": record[1]}
+
+def _diff_brush_info(record, entities):
+    return {"entity": record[0], "classname": entities[record[0]][1], "brush": record[1]}
+
+def diff_maps(path_a, path_b, flips=None, tolerance=DIFF_DEFAULT_TOLERANCE, dialect=None):
+    """Structural diff of two maps. With flips=(flip_x, flip_y, flip_z), map a is flipped
+    first, to check that b is its flip. Numbers at most tolerance apart (map units; plane
+    normals use 1/100 of it) count as equal.
+
+    Returns a dict with matched counts and the added (only in b), removed (only in a) and
+    modified entities and brushes. Entity and brush numbers are 0-based file order.
+    """
+    if tolerance <= 0:
+        raise ValueError("Tolerance must be greater than zero.")
+    if flips is not None and not any(flips):
+        flips = None
+    entities_a, brushes_a = _diff_read_map(path_a, flips, tolerance, dialect)
+    entities_b, brushes_b = _diff_read_map(path_b, None, tolerance, dialect)
+
+    entities_matched, left_a, left_b = _diff_match(entities_a, entities_b)
+    near_matched, left_a, left_b = _diff_near_match(left_a, left_b,
+                                                    lambda r: _diff_entity_signature(r, tolerance),
+                                                    lambda a, b: _diff_close(a, b, tolerance))
+    entities_matched += near_matched
+    entity_edits, entities_removed, entities_added = _diff_pair_entities(left_a, left_b)
+    modified_entities = []
+    for a, b in entity_edits:
+        changed = {key: [a[2].get(key), b[2].get(key)] for key in sorted(set(a[2]) | set(b[2]))
+                   if not _diff_values_close(a[2].get(key), b[2].get(key), tolerance)}
+        modified_entities.append({"a": _diff_entity_info(a), "b": _diff_entity_info(b), "changed": changed})
+
+    brushes_matched, left_a, left_b = _diff_match(brushes_a, brushes_b)
+    near_matched, left_a, left_b = _diff_near_match(left_a, left_b,
+                                                    lambda r: _diff_brush_signature(r, tolerance),
+                                                    lambda a, b: _diff_planes_close(a, b, tolerance))
+    brushes_matched += near_matched
+    brush_edits, brushes_removed, brushes_added = _diff_pair_brushes(left_a, left_b)
+    modified_brushes = [{"a": _diff_brush_info(a, entities_a), "b": _diff_brush_info(b, entities_b),
+                         "planes_changed": max(len(set(a[3]) - set(b[3])), len(set(b[3]) - set(a[3])))}
+                        for a, b in brush_edits]
+    entities_added = [_diff_entity_info(r) for r in entities_added]
+    entities_removed = [_diff_entity_info(r) for r in entities_removed]
+    brushes_added = [_diff_brush_info(r, entities_b) for r in brushes_added]
+    brushes_removed = [_diff_brush_info(r, entities_a) for r in brushes_removed]
+
+    return {
+        "a": path_a,
+        "b": path_b,
+        "flip": "".join(a for a, on in zip("xyz", flips) if on) if flips else None,
+        "tolerance": tolerance,
+        "identical": not (entities_added or entities_removed or modified_entities
+                          or brushes_added or brushes_removed or modified_brushes),
+        "entities": {
+            "matched": entities_matched,
+            "added": entities_added,
+            "removed": entities_removed,
+            "modified": modified_entities,
+        },
+        "brushes": {
+            "matched": brushes_matched,
+            "added": brushes_added,
+            "removed": brushes_removed,
+            "modified": modified_brushes,
+        },
+    }
+
+
+# --- Flip Service (persistent daemon) ---
+# Editor save hooks used to start a fresh Python per save; most of a small job was
+# interpreter startup and regex compilation. The service keeps worker processes warm
+# and accepts jobs over localhost HTTP or a Unix socket.
+SERVICE_DEFAULT_HOST = "127.0.0.1"
+SERVICE_DEFAULT_PORT = 26026
+
+class ServiceBusyError(Exception):
+    """Raised when the service queue is full; clients should retry later."""
+
+def parse_axes(axes):
+    """Turns an axis string such as "xy" into (flip_x, flip_y, flip_z)."""
+    axes = (axes or "").lower()
+    unknown = set(axes) - set("xyz")
+    if unknown:
+        raise ValueError(f"Unknown axis: {''.join(sorted(unknown))}")
+    return ("x" in axes, "y" in axes, "z" in axes)
+
+def _service_worker_init():
+    # Run one tiny job so the first real job doesn't pay for lazy setup.
+    flip_map_bytes(b'{\n"classname" "worldspawn"\n}\n', True, False, False)
+
+def _run_service_job(job):
+    flip_x, flip_y, flip_z = parse_axes(job.get("axes"))
+    options = job.get("options") or {}
+    if "data" in job:
+        return flip_map_bytes(job["data"], flip_x, flip_y, flip_z, **options)
+    flip_map_file(job["input"], job["output"], flip_x, flip_y, flip_z, **options)
+    return None
+
+def latency_percentiles(samples, percentiles=(50, 90, 95, 99)):
+    """Nearest-rank percentiles (in milliseconds) of a list of latencies in seconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {}
+    for p in percentiles:
+        rank = max(1, int(math.ceil(p / 100.0 * len(ordered))))
+        result[f"p{p}"] = round(ordered[rank - 1] * 1000.0, 3)
+    result["max"] = round(ordered[-1] * 1000.0, 3)
+    return result
+
+class FlipService:
+    """Bounded worker pool with backpressure and latency bookkeeping."""
+
+    def __init__(self, workers=None, max_pending=None, history=10000):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = self.workers * 2 if max_pending is None else max_pending
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_service_worker_init)
+        # Jobs running plus jobs waiting; anything beyond this is turned away.
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=history)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    def warm_up(self):
+        # Starting the pool before the server threads exist avoids forking a threaded process.
+        for future in [self.executor.submit(parse_axes, "x") for _ in range(self.workers)]:
+            future.result()
+
+    def run(self, job):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceBusyError("Flip service is busy, try again shortly.")
+        start = time.perf_counter()
+        try:
+            result = self.executor.submit(_run_service_job, job).result()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            self._slots.release()
+        with self._lock:
+            self.completed += 1
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        with self._lock:
+            samples = list(self._latencies)
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "uptime_s": round(time.time() - self.started, 1),
+                "latency_ms": latency_percentiles(samples),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+class _FlipRequestHandler(http.server.BaseHTTPRequestHandler):
+    """POST /flip (JSON paths), POST /stream?axes=xy (raw bytes), GET /stats."""
+    protocol_version = "HTTP/1.1"
+    verbose = False
+
+    def address_string(self):
+        # Unix socket peers have no host/port.
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, code, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == "/stats":
+            self._reply(200, self.server.flip_service.stats())
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        try:
+            if url.path == "/flip":
+                job = json.loads(self._read_body() or b"{}")
+                if not job.get("input") or not job.get("output"):
+                    raise ValueError("Job needs both 'input' and 'output' paths.")
+                self.server.flip_service.run(job)
+                self._reply(200, {"ok": True, "output": job["output"]})
+            elif url.path == "/stream":
+                query = urllib.parse.parse_qs(url.query)
+                job = {"axes": query.get("axes", [""])[0], "data": self._read_body()}
+                if "options" in query:
+                    job["options"] = json.loads(query["options"][0])
+                self._reply(200, self.server.flip_service.run(job), "application/octet-stream")
+            else:
+                self._reply(404, {"error": "Not found"})
+        except ServiceBusyError as e:
+            self._reply(503, {"error": str(e)}, headers={"Retry-After": "1"})
+        except (ValueError, TypeError, KeyError, FileNotFoundError) as e:
+            self._reply(400, {"error": str(e)})
+        except Exception as e:
+            self._reply(500, {"error": f"An unexpected error occurred: {e}"})
+
+class _FlipHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+if hasattr(socket, "AF_UNIX"):
+    class _FlipUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def _is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+def _is_loopback_host(host):
+    """True if every address the host name resolves to is a loopback address."""
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    try:
+        return all(ipaddress.ip_address(info[4][0].split("%", 1)[0]).is_loopback for info in infos)
+    except ValueError:
+        return False
+
+def serve_flip_service(host=SERVICE_DEFAULT_HOST, port=SERVICE_DEFAULT_PORT, socket_path=None,
+                       workers=None, max_pending=None, verbose=False):
+    """Runs the flip service until interrupted, then prints latency percentiles.
+
+    /flip reads and writes any path the server user can, without authentication, so HTTP
+    is only served on loopback addresses. A stale socket_path is replaced only if it is a socket.
+    """
+    if socket_path:
+        if os.path.lexists(socket_path) and not _is_socket(socket_path):
+            raise ValueError(f"Refusing to replace {socket_path}: it exists and is not a socket.")
+    elif not _is_loopback_host(host):
+        raise ValueError(f"The flip service has no authentication; it only listens on loopback addresses, not {host}.")
+    service = FlipService(workers, max_pending)
+    service.warm_up()
+    _FlipRequestHandler.verbose = verbose
+    if socket_path:
+        if _is_socket(socket_path):
+            os.unlink(socket_path)
+        server = _FlipUnixServer(socket_path, _FlipRequestHandler)
+        where = socket_path
+    else:
+        server = _FlipHTTPServer((host, port), _FlipRequestHandler)
+        where = f"http://{host}:{server.server_address[1]}"
+    server.flip_service = service
+    print(f"Flip service listening on {where} ({service.workers} workers, {service.max_pending} queued max)")
+    if hasattr(signal, "SIGTERM"):
+        # serve_forever() blocks this thread, so shutdown has to come from another one.
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and _is_socket(socket_path):
+            os.unlink(socket_path)
+        service.shutdown()
+        print(json.dumps(service.stats(), indent=2))
+
+class FlipServiceClient:
+    """Thin client for the flip service. Retries with backoff while the service is busy."""
+
+    def __init__(self, host=SERVICE_DEFAULT_HOST, port=SERVICE_DEFAULT_PORT, socket_path=None,
+                 timeout=300, retries=20):
+        self.host, self.port, self.socket_path = host, port, socket_path
+        self.timeout = timeout
+        self.retries = retries
+
+    def _connect(self):
+        if self.socket_path:
+            return _UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _request(self, method, path, body=None, content_type="application/json"):
+        delay = 0.05
+        for attempt in range(self.retries + 1):
+            conn = self._connect()
+            try:
+                conn.request(method, path, body=body, headers={"Content-Type": content_type})
+                response = conn.getresponse()
+                data = response.read()
+            finally:
+                conn.close()
+            if response.status == 503 and attempt < self.retries:
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+                continue
+            if response.status != 200:
+                try:
+                    message = json.loads(data).get("error", data)
+                except ValueError:
+                    message = data
+                raise RuntimeError(f"Flip service error {response.status}: {message}")
+            return data
+
+    def flip_file(self, input_path, output_path, axes, **options):
+        job = {"input": os.path.abspath(input_path), "output": os.path.abspath(output_path),
+               "axes": axes, "options": options}
+        return json.loads(self._request("POST", "/flip", json.dumps(job).encode("utf-8")))
+
+    def flip_bytes(self, data, axes, **options):
+        query = {"axes": axes}
+        if options:
+            query["options"] = json.dumps(options)
+        return self._request("POST", "/stream?" + urllib.parse.urlencode(query), data,
+                             "application/octet-stream")
+
+    def stats(self):
+        return json.loads(self._request("GET", "/stats"))
+
 
 # --- GUI Setup (Identical GUI Code as before) ---
 class MapFlipperApp:
     def __init__(self, master):
         self.master = master
         master.title("Quake .map Flipper")
-        master.geometry("500x310") # Slightly taller for notes
+        master.geometry("500x340") # Slightly taller for notes
 
         self.input_path = tk.StringVar()
         self.output_path = tk.StringVar()
         self.flip_x = tk.BooleanVar()
         self.flip_y = tk.BooleanVar()
         self.flip_z = tk.BooleanVar()
+        self.debug_files = tk.BooleanVar(value=False)
 
         # Input File Section
         input_frame = ttk.LabelFrame(master, text="Input Map File", padding=(10, 5))
@@ -231,6 +2727,8 @@ class MapFlipperApp:
         ttk.Checkbutton(axis_frame, text="Flip X Axis", variable=self.flip_x).pack(side=tk.LEFT, padx=5)
         ttk.Checkbutton(axis_frame, text="Flip Y Axis", variable=self.flip_y).pack(side=tk.LEFT, padx=5)
         ttk.Checkbutton(axis_frame, text="Flip Z Axis", variable=self.flip_z).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(master, text="Also flip .pts/.lin/.prt files next to the map",
+                        variable=self.debug_files).pack(pady=(0, 5))
 
         # Action Button & Status
         self.status_label = ttk.Label(master, text="Ready. Remember to test the flipped map.")
@@ -254,6 +2752,11 @@ class MapFlipperApp:
         if filename:
             self.output_path.set(filename)
 
+    def show_progress(self, bytes_done, total_bytes):
+        if total_bytes:
+            self.status_label.config(text=f"Processing... {100.0 * bytes_done / total_bytes:.0f}%")
+            self.master.update_idletasks()
+
     def run_flip(self):
         in_file = self.input_path.get()
         out_file = self.output_path.get()
@@ -265,7 +2768,8 @@ class MapFlipperApp:
         self.note_label.config(text="Note: Texture/Angle flipping is heuristic. Message/Map names updated.")
         self.master.update_idletasks()
 
-        success = process_map_file(in_file, out_file, self.flip_x.get(), self.flip_y.get(), self.flip_z.get())
+        success = process_map_file(in_file, out_file, self.flip_x.get(), self.flip_y.get(), self.flip_z.get(),
+                                   progress=self.show_progress, debug_files=self.debug_files.get())
 
         if success:
             final_msg = f"Map successfully flipped!\nOutput saved to:\n{out_file}\n\nWorldspawn message and changelevel maps were updated.\nRemember to test thoroughly!"
@@ -277,7 +2781,318 @@ class MapFlipperApp:
              self.note_label.config(text="See error message / console output.")
 
 
+# --- Command Line ---
+def _add_axis_args(parser):
+    parser.add_argument("-x", "--flip-x", action="store_true", help="Flip X axis")
+    parser.add_argument("-y", "--flip-y", action="store_true", help="Flip Y axis")
+    parser.add_argument("-z", "--flip-z", action="store_true", help="Flip Z axis")
+
+def _axes_from_args(args):
+    return "".join(a for a, on in zip("xyz", (args.flip_x, args.flip_y, args.flip_z)) if on)
+
+def _add_service_address_args(parser):
+    parser.add_argument("--host", default=SERVICE_DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_DEFAULT_PORT)
+    parser.add_argument("--socket", dest="socket_path", help="Use a Unix socket instead of localhost HTTP")
+
+def _add_dialect_arg(parser):
+    parser.add_argument("--dialect", default=DIALECT_AUTO, choices=[DIALECT_AUTO, *MAP_DIALECTS],
+                        help="Map format; by default detected from the first brush")
+
+def _add_texture_map_arg(parser):
+    parser.add_argument("--texture-map", help="Texture remap table: 'source replacement [offset_x offset_y]' per line")
+
+def _add_memo_args(parser, stats=True):
+    parser.add_argument("--memo", type=int, nargs="?", const=MEMO_DEFAULT_SIZE, default=0, metavar="SIZE",
+                        help=f"Memoize repeated face/key lines in an LRU of SIZE entries (default {MEMO_DEFAULT_SIZE})")
+    if stats:
+        parser.add_argument("--stats", action="store_true", help="Print line and memo statistics as JSON")
+
+def _add_prefab_args(parser):
+    parser.add_argument("--prefabs", action="store_true",
+                        help="Write flipped copies of misc_external_map / func_instance prefabs and point the instances at them")
+    parser.add_argument("--prefab-dir", action="append", default=[], help="Extra directory to search for prefabs")
+
+def _add_wad_args(parser):
+    parser.add_argument("--wad-dir", action="append", default=[], help="Extra directory to search for worldspawn WADs")
+    parser.add_argument("--no-wads", dest="use_wads", action="store_false", help="Don't read WADs for texture sizes")
+
+def _cmd_flip(args):
+    progress = ProgressPrinter() if args.progress and sys.stderr.isatty() else None
+    classnames = {name.strip() for name in args.classname.split(",") if name.strip()} if args.classname else None
+    stats = {} if args.stats else None
+    try:
+        flip_map_file(args.input, args.output, args.flip_x, args.flip_y, args.flip_z,
+                      wad_dirs=args.wad_dir, use_wads=args.use_wads, progress=progress,
+                      entities=not args.brushes_only, brushes=not args.entities_only, classnames=classnames,
+                      dialect=args.dialect, texture_map=args.texture_map, pipeline=args.pipeline,
+                      memo_size=args.memo, stats=stats, prefabs=args.prefabs, prefab_dirs=args.prefab_dir)
+    finally:
+        if progress:
+            progress.finish()
+    if args.stats:
+        print(json.dumps(stats, indent=2))
+    print(f"Map successfully flipped! Output saved to: {args.output}")
+    if args.debug_files:
+        for path in flip_debug_files(args.input, args.output, args.flip_x, args.flip_y, args.flip_z):
+            print(f"Debug file flipped: {path}")
+    return 0
+
+def _cmd_entities(args):
+    path = flip_entity_file(args.input, args.output, args.flip_x, args.flip_y, args.flip_z, in_place=args.in_place)
+    print(f"Entities flipped! Output saved to: {path}")
+    return 0
+
+def _cmd_flip_debug(args):
+    flip_debug_file(args.input, args.output, args.flip_x, args.flip_y, args.flip_z)
+    print(f"Debug file flipped! Output saved to: {args.output}")
+    return 0
+
+def _cmd_fanout(args):
+    base, ext = os.path.splitext(args.input)
+    outputs = []
+    for axes in args.variants:
+        flip_x, flip_y, flip_z = parse_axes(axes)
+        output = args.output_pattern.format(base=base, ext=ext, axes=axes.lower())
+        outputs.append((output, flip_x, flip_y, flip_z))
+    progress = ProgressPrinter() if args.progress and sys.stderr.isatty() else None
+    stats = {}
+    try:
+        flip_map_file_multi(args.input, outputs, wad_dirs=args.wad_dir, use_wads=args.use_wads, progress=progress,
+                            dialect=args.dialect, texture_map=args.texture_map, memo_size=args.memo, stats=stats,
+                            prefabs=args.prefabs, prefab_dirs=args.prefab_dir)
+    finally:
+        if progress:
+            progress.finish()
+    if args.stats:
+        print(json.dumps(stats, indent=2))
+    for output, _, _, _ in outputs:
+        print(f"Map successfully flipped! Output saved to: {output}")
+    return 0
+
+def _cmd_mirror(args):
+    stats = mirror_merge_map_file(args.input, args.output, args.flip_x, args.flip_y, args.flip_z,
+                                  wad_dirs=args.wad_dir, use_wads=args.use_wads, dialect=args.dialect,
+                                  texture_map=args.texture_map)
+    print(json.dumps(stats, indent=2))
+    print(f"Symmetric map saved to: {args.output}")
+    return 0
+
+def _cmd_serve(args):
+    serve_flip_service(args.host, args.port, args.socket_path, args.workers, args.max_pending, args.verbose)
+    return 0
+
+def _client_options(args):
+    """The flip options of a client job, with paths made absolute for the service."""
+    absolute = lambda paths: [os.path.abspath(path) for path in paths]
+    options = {"dialect": args.dialect, "memo_size": args.memo}
+    if args.texture_map:
+        options["texture_map"] = os.path.abspath(args.texture_map)
+    if args.stream:
+        if args.prefabs:
+            raise ValueError("Prefabs need a file job; drop --stream.")
+        # flip_map_bytes has no map path, so the map's own directory goes first, as flip does
+        map_dirs = [os.path.dirname(os.path.abspath(args.input))] if args.input != "-" else []
+        options["wad_dirs"] = [*map_dirs, *absolute(args.wad_dir)] if args.use_wads else None
+    else:
+        options.update(wad_dirs=absolute(args.wad_dir), use_wads=args.use_wads,
+                       prefabs=args.prefabs, prefab_dirs=absolute(args.prefab_dir))
+    return options
+
+def _cmd_client(args):
+    client = FlipServiceClient(args.host, args.port, args.socket_path)
+    if args.stats:
+        print(json.dumps(client.stats(), indent=2))
+        return 0
+    if not args.input or not args.output:
+        raise ValueError("Please specify both input and output files.")
+    axes = _axes_from_args(args)
+    options = _client_options(args)
+    if args.stream:
+        # "-" reads stdin / writes stdout so the client can sit in a pipe.
+        if args.input == "-":
+            data = sys.stdin.buffer.read()
+        else:
+            with open(args.input, "rb") as f:
+                data = f.read()
+        result = client.flip_bytes(data, axes, **options)
+        if args.output == "-":
+            sys.stdout.buffer.write(result)
+        else:
+            with open(args.output, "wb") as f:
+                f.write(result)
+    else:
+        client.flip_file(args.input, args.output, axes, **options)
+    return 0
+
+def _cmd_inspect(args):
+    reports = inspect_maps(args.paths, args.jobs)
+    if len(reports) == 1 and not any(os.path.isdir(p) for p in args.paths):
+        reports = reports[0]
+    print(json.dumps(reports, indent=args.indent))
+    return 0
+
+def _cmd_benchmark(args):
+    flip_x, flip_y, flip_z = parse_axes(args.axes)
+    result = benchmark_pipeline(args.input, flip_x, flip_y, flip_z, args.io_delay / 1000.0, args.repeat)
+    print(json.dumps(result, indent=2))
+    return 0
+
+def _cmd_preview(args):
+    for written in preview_maps(args.maps, args.out_dir, args.side, args.size, args.jobs):
+        for path in written:
+            print(f"Preview saved to: {path}")
+    return 0
+
+def _cmd_diff(args):
+    flips = (args.flip_x, args.flip_y, args.flip_z) if (args.flip_x or args.flip_y or args.flip_z) else None
+    report = diff_maps(args.a, args.b, flips, args.tolerance, args.dialect)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0 if report["identical"] else 1
+    describe = lambda info: (f"brush {info['brush']} of " if "brush" in info else "") + \
+        f"entity {info['entity']} ({info['classname']})"
+    for kind in ("entities", "brushes"):
+        section = report[kind]
+        print(f"{kind.capitalize()}: {section['matched']} matched, {len(section['added'])} added, "
+              f"{len(section['removed'])} removed, {len(section['modified'])} modified")
+        for sign, name in (("+", "added"), ("-", "removed")):
+            for info in section[name][:args.limit]:
+                print(f"  {sign} {describe(info)}")
+        for edit in section["modified"][:args.limit]:
+            quote = lambda value: "(absent)" if value is None else f'"{value}"'
+            detail = (", ".join(f'{key} {quote(old)} -> {quote(new)}' for key, (old, new) in edit["changed"].items())
+                      if "changed" in edit else f"{edit['planes_changed']} plane(s) changed")
+            print(f"  ~ {describe(edit['a'])} -> {describe(edit['b'])}: {detail}")
+    print("Maps match." if report["identical"] else "Maps differ.")
+    return 0 if report["identical"] else 1
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Quake .map flipper. Run without arguments for the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("flip", help="Flip a map file")
+    p.add_argument("input")
+    p.add_argument("output")
+    _add_axis_args(p)
+    _add_wad_args(p)
+    _add_dialect_arg(p)
+    _add_texture_map_arg(p)
+    p.add_argument("--no-progress", dest="progress", action="store_false", help="Don't show the live progress line")
+    _add_memo_args(p)
+    _add_prefab_args(p)
+    only = p.add_mutually_exclusive_group()
+    only.add_argument("--entities-only", action="store_true", help="Only rewrite entity keys; copy brushes untouched")
+    only.add_argument("--brushes-only", action="store_true", help="Only flip brush faces; copy entity keys untouched")
+    p.add_argument("--classname", help="Comma-separated classnames; other entities are copied untouched")
+    p.add_argument("--pipeline", action="store_true",
+                   help="Read and write on background threads (faster on network or slow storage)")
+    p.add_argument("--debug-files", action="store_true",
+                   help="Also flip the .pts/.lin/.prt files next to the input map")
+    p.set_defaults(func=_cmd_flip)
+
+    p = commands.add_parser("entities", help="Flip only the entities of a .ent file or a .bsp entity lump")
+    p.add_argument("input", help=".ent or .bsp file")
+    p.add_argument("output", nargs="?", help=".ent for the entity text, or .bsp for a patched copy")
+    _add_axis_args(p)
+    p.add_argument("--in-place", action="store_true", help="Rewrite the input file itself")
+    p.set_defaults(func=_cmd_entities)
+
+    p = commands.add_parser("flip-debug", help="Flip a single .pts, .lin or .prt compiler debug file")
+    p.add_argument("input")
+    p.add_argument("output")
+    _add_axis_args(p)
+    p.set_defaults(func=_cmd_flip_debug)
+
+    p = commands.add_parser("fanout", help="Write several flips of one map in a single pass")
+    p.add_argument("input")
+    p.add_argument("variants", nargs="+", help="Axis sets, e.g. x y xy xyz")
+    p.add_argument("--output-pattern", default="{base}_flipped_{axes}{ext}",
+                   help="Output name; {base}, {ext} and {axes} are filled in (default: %(default)s)")
+    _add_wad_args(p)
+    _add_dialect_arg(p)
+    _add_texture_map_arg(p)
+    p.add_argument("--no-progress", dest="progress", action="store_false", help="Don't show the live progress line")
+    _add_memo_args(p)
+    _add_prefab_args(p)
+    p.set_defaults(func=_cmd_fanout)
+
+    p = commands.add_parser("mirror", help="Build a symmetric map: original plus its mirror, duplicates removed")
+    p.add_argument("input")
+    p.add_argument("output")
+    _add_axis_args(p)
+    _add_wad_args(p)
+    _add_dialect_arg(p)
+    _add_texture_map_arg(p)
+    p.set_defaults(func=_cmd_mirror)
+
+    p = commands.add_parser("inspect", help="Print quick facts about maps as JSON (no output map)")
+    p.add_argument("paths", nargs="+", help="Map files or directories of maps")
+    p.add_argument("--jobs", type=int, help="Parallel processes for many maps (default: CPU count)")
+    p.add_argument("--indent", type=int, default=2)
+    p.set_defaults(func=_cmd_inspect)
+
+    p = commands.add_parser("benchmark", help="Time the serial flip loop against --pipeline on simulated slow storage")
+    p.add_argument("input")
+    p.add_argument("--axes", default="x", help="Axes to flip (default: %(default)s)")
+    p.add_argument("--io-delay", type=float, default=100.0,
+                   help="Simulated storage delay in ms per MB, for both reading and writing (default: %(default)s)")
+    p.add_argument("--repeat", type=int, default=1, help="Runs per mode; the best is reported")
+    p.set_defaults(func=_cmd_benchmark)
+
+    p = commands.add_parser("preview", help="Draw top-down (and side) PNG previews of maps, e.g. before and after a flip")
+    p.add_argument("maps", nargs="+")
+    p.add_argument("--side", action="store_true", help="Also draw a side view (X across, Z up)")
+    p.add_argument("--size", type=int, default=PREVIEW_DEFAULT_SIZE, help="Longest image side in pixels (default: %(default)s)")
+    p.add_argument("--out-dir", help="Where to write the PNGs (default: next to each map)")
+    p.add_argument("--jobs", type=int, help="Parallel processes for several maps (default: CPU count)")
+    p.set_defaults(func=_cmd_preview)
+
+    p = commands.add_parser("diff", help="Compare two maps by entities and brushes (exit status 1 if they differ)")
+    p.add_argument("a")
+    p.add_argument("b")
+    _add_axis_args(p) # Any axis given: compare b against the flip of a
+    p.add_argument("--tolerance", type=float, default=DIFF_DEFAULT_TOLERANCE,
+                   help="Numbers at most this far apart match (default: %(default)s)")
+    _add_dialect_arg(p)
+    p.add_argument("--limit", type=int, default=20, help="Items listed per change type (default: %(default)s)")
+    p.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    p.set_defaults(func=_cmd_diff)
+
+    p = commands.add_parser("serve", help="Run the persistent flip service")
+    _add_service_address_args(p)
+    p.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    p.add_argument("--max-pending", type=int, help="Queued jobs before the service answers busy (default: 2x workers)")
+    p.add_argument("--verbose", action="store_true", help="Log every request")
+    p.set_defaults(func=_cmd_serve)
+
+    p = commands.add_parser("client", help="Send a flip job to a running flip service")
+    p.add_argument("input", nargs="?")
+    p.add_argument("output", nargs="?")
+    _add_axis_args(p)
+    _add_service_address_args(p)
+    p.add_argument("--stream", action="store_true", help="Send the map bytes instead of its path")
+    p.add_argument("--stats", action="store_true", help="Print service latency percentiles and exit")
+    _add_wad_args(p)
+    _add_dialect_arg(p)
+    _add_texture_map_arg(p)
+    _add_memo_args(p, stats=False)
+    _add_prefab_args(p)
+    p.set_defaults(func=_cmd_client)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
     root = tk.Tk()
     app = MapFlipperApp(root)
     root.mainloop()